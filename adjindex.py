@@ -0,0 +1,141 @@
+#!/bin/python3
+
+import numpy as np
+
+class AdjacencyIndex:
+    """
+    Adjacency of a directed graph kept as compressed sparse row (CSR) arrays for
+    both directions. It is built once from an edge list; successor, predecessor and
+    reachability queries then run over the arrays without touching the edge list again.
+    Node ids may be any hashable values; integer edge lists are indexed with numpy only.
+    """
+    def __init__(self, edges):
+        src, dst, self.keys = _encode_edges(edges)
+        self.num_nodes = len(self.keys)
+        self.num_edges = len(src)
+        self.out_ptr, self.out_idx = _build_csr(src, dst, self.num_nodes)
+        self.in_ptr, self.in_idx = _build_csr(dst, src, self.num_nodes)
+        self._lookup = None
+        self._undirected = None
+
+    @classmethod
+    def from_arrays(cls, src, dst):
+        return cls(np.column_stack((np.asarray(src), np.asarray(dst))))
+
+    def index_of(self, node):
+        """
+        Dense index of a node id, raises KeyError if the node is not in the graph
+        """
+        if self.keys.dtype.kind in 'iu':
+            i = np.searchsorted(self.keys, node)
+            if i < self.num_nodes and self.keys[i] == node:
+                return int(i)
+            raise KeyError(node)
+        if self._lookup is None:
+            self._lookup = {k: i for i, k in enumerate(self.keys.tolist())}
+        return self._lookup[node]
+
+    def successors(self, node):
+        i = self.index_of(node)
+        return self.keys[self.out_idx[self.out_ptr[i]:self.out_ptr[i+1]]].tolist()
+
+    def predecessors(self, node):
+        i = self.index_of(node)
+        return self.keys[self.in_idx[self.in_ptr[i]:self.in_ptr[i+1]]].tolist()
+
+    def undirected(self):
+        """
+        CSR arrays of the graph with edge directions ignored
+        """
+        if self._undirected is None:
+            src = np.repeat(np.arange(self.num_nodes), np.diff(self.out_ptr))
+            both_src = np.concatenate((src, self.out_idx))
+            both_dst = np.concatenate((self.out_idx, src))
+            self._undirected = _build_csr(both_src, both_dst, self.num_nodes)
+        return self._undirected
+
+    def descendants(self, node):
+        """
+        All nodes reachable from node, in BFS order (node itself excluded)
+        """
+        return self.keys[bfs_order(self.out_ptr, self.out_idx, self.index_of(node))[1:]].tolist()
+
+    def ancestors(self, node):
+        """
+        All nodes node can be reached from, in BFS order (node itself excluded)
+        """
+        return self.keys[bfs_order(self.in_ptr, self.in_idx, self.index_of(node))[1:]].tolist()
+
+
+def _encode_edges(edges):
+    """
+    Map the edge endpoints to dense indices 0..n-1
+    :return: src, dst index arrays and the array of node ids (sorted for integer ids)
+    """
+    arr = np.asarray(edges)
+    if arr.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    if arr.dtype.kind in 'iu' and arr.ndim == 2:
+        keys, inverse = np.unique(arr[:, :2].ravel(), return_inverse=True)
+        inverse = inverse.reshape(-1, 2)
+        return inverse[:, 0], inverse[:, 1], keys
+    # Mixed or non-numeric ids (e.g. 'Exit'): number them in order of appearance
+    lookup = {}
+    src = np.fromiter((lookup.setdefault(e[0], len(lookup)) for e in edges), dtype=np.int64)
+    dst = np.fromiter((lookup.setdefault(e[1], len(lookup)) for e in edges), dtype=np.int64)
+    keys = np.empty(len(lookup), dtype=object)
+    keys[:] = list(lookup)
+    return src, dst, keys
+
+def _build_csr(src, dst, n):
+    order = np.argsort(src, kind='stable')
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=ptr[1:])
+    return ptr, dst[order]
+
+def gather_neighbors(ptr, idx, frontier):
+    """
+    Concatenated neighbor lists of all nodes in frontier
+    """
+    starts = ptr[frontier]
+    lens = ptr[frontier + 1] - starts
+    total = int(lens.sum())
+    if total == 0:
+        return idx[:0]
+    offsets = np.repeat(starts - np.cumsum(lens) + lens, lens)
+    return idx[offsets + np.arange(total)]
+
+def bfs_order(ptr, idx, start):
+    """
+    Visit order of a BFS from start over a CSR adjacency, one vectorized step per level,
+    so the whole traversal is linear in the number of nodes and edges reached
+    """
+    seen = np.zeros(len(ptr) - 1, dtype=bool)
+    seen[start] = True
+    frontier = np.array([start], dtype=np.int64)
+    order = [frontier]
+    while frontier.size:
+        nbrs = gather_neighbors(ptr, idx, frontier)
+        nbrs = nbrs[~seen[nbrs]]
+        # keep the first occurrence of each node, in discovery order
+        _, first = np.unique(nbrs, return_index=True)
+        frontier = nbrs[np.sort(first)]
+        seen[frontier] = True
+        order.append(frontier)
+    return np.concatenate(order)
+
+def bfs_distances(ptr, idx, start):
+    """
+    Hop distance from start to every node over a CSR adjacency, -1 where unreachable
+    """
+    dist = np.full(len(ptr) - 1, -1, dtype=np.int64)
+    dist[start] = 0
+    frontier = np.array([start], dtype=np.int64)
+    level = 0
+    while frontier.size:
+        level += 1
+        nbrs = gather_neighbors(ptr, idx, frontier)
+        frontier = np.unique(nbrs[dist[nbrs] < 0])
+        dist[frontier] = level
+    return dist
@@ -0,0 +1,147 @@
+#!/bin/python3
+
+## Batch generation of random mesh graphs on all cores.
+## Example:
+##   python batchgen.py --spec '{"mode": "Managed", "nodes": 200, "layers": 10}' --count 5000 --out corpus/
+##   python batchgen.py --spec semi.json --count 1000 --format npz --seed 7
+## Every graph gets its own seed spawned from --seed, so a corpus is reproducible
+## whatever the number of workers is.
+
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from daggen import DAGs_generate_arrays
+from feasibility import check_managed_params, check_semi_managed_params, describe
+from managed_daggen import random_dag_arrays
+
+# Same defaults as the "Random Mesh Graph" panel of the GUI
+DEFAULT_SPEC = {'mode': "Managed", 'nodes': 50, 'max_out': 5, 'alpha': 1.0, 'beta': 0.5,
+                'layers': 6, 'first_layer': 4, 'min_per_layer': 5, 'max_per_layer': 12, 'accurate': 1}
+
+def load_spec(text):
+    """
+    Parameter spec from a JSON file or an inline JSON string, completed with the defaults
+    """
+    if os.path.exists(text):
+        with open(text, "r") as f:
+            text = f.read()
+    spec = dict(DEFAULT_SPEC)
+    spec.update(json.loads(text))
+    if spec['mode'] not in ("Managed", "Semi-Managed"):
+        raise ValueError(f"Unknown mode: {spec['mode']}")
+    return spec
+
+def check_spec(spec):
+    """
+    Feasibility of the spec, checked before any generation work starts
+    """
+    if spec['mode'] == "Semi-Managed":
+        return check_semi_managed_params(spec['nodes'], spec['max_out'], spec['alpha'], spec['beta'])
+    return check_managed_params(spec['nodes'], spec['layers'], spec['min_per_layer'], spec['max_per_layer'],
+                                spec['first_layer'], spec['accurate'])
+
+def generate_graph(spec, rng):
+    """
+    Generate one graph as described by spec
+    :return: src, dst int32 edge arrays (node 0 is the border router), empty if no solution was found
+    """
+    if spec['mode'] == "Semi-Managed":
+        src, dst, _ = DAGs_generate_arrays(spec['nodes'], spec['max_out'], spec['alpha'], spec['beta'], rng)
+        return src, dst
+    src, dst, _ = random_dag_arrays(spec['nodes'], spec['layers'], spec['min_per_layer'], spec['max_per_layer'],
+                                    spec['first_layer'], spec['max_out'], spec['accurate'], rng)
+    return src, dst
+
+def write_graph_file(filename, src, dst):
+    """
+    Write edges in the .graph format of the GUI export (1-based node indices)
+    """
+    num_nodes = int(max(src.max(), dst.max())) + 1
+    lines = [f"{num_nodes}"]
+    lines.extend(f"{u},{v}" for u, v in zip((src + 1).tolist(), (dst + 1).tolist()))
+    lines.append("---")
+    with open(filename, "w") as f:
+        f.write("\n".join(lines))
+
+def read_graph_file(filename):
+    """
+    Read a .graph file
+    :return: number of nodes, list of [n1, n2] edges with 0-based node indices
+    """
+    with open(filename, "r") as f:
+        lines = f.readlines()
+    num_nodes = int(lines[0])
+    edges = []
+    for line in lines[1:]:
+        if "---" in line:
+            break
+        n1, n2 = line.split(",")
+        edges.append([int(n1) - 1, int(n2) - 1])
+    return num_nodes, edges
+
+def write_npz_file(filename, src, dst):
+    """
+    Compact binary format: num_nodes and the int32 src/dst arrays (0-based)
+    """
+    num_nodes = int(max(src.max(), dst.max())) + 1
+    np.savez(filename, num_nodes=np.int32(num_nodes), src=src.astype(np.int32), dst=dst.astype(np.int32))
+
+def _generate_one(task):
+    i, spec, seed_seq, out_dir, fmt = task
+    src, dst = generate_graph(spec, np.random.default_rng(seed_seq))
+    if len(src) == 0:
+        return i, None
+    filename = os.path.join(out_dir, f"graph_{i:06d}.{fmt}")
+    if fmt == "graph":
+        write_graph_file(filename, src, dst)
+    else:
+        write_npz_file(filename, src, dst)
+    return i, filename
+
+def run_batch(spec, count, out_dir, fmt="graph", seed=None, jobs=None):
+    """
+    Generate count graphs with a process pool, files are written by the workers as they finish
+    :return: number of graphs written
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    seeds = np.random.SeedSequence(seed).spawn(count)
+    tasks = ((i, spec, seeds[i], out_dir, fmt) for i in range(count))
+    written = 0
+    failed = 0
+    start = time.time()
+    with Pool(jobs) as pool:
+        for i, filename in pool.imap_unordered(_generate_one, tasks, chunksize=max(1, min(64, count // 256))):
+            if filename is None:
+                failed += 1
+            else:
+                written += 1
+            done = written + failed
+            if done % 100 == 0 or done == count:
+                print(f"{done}/{count} graphs, {failed} without solution, {time.time() - start:.1f} s")
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate random mesh graphs in batch")
+    parser.add_argument('--spec', default='{}', type=str, help="JSON file or string with generation parameters")
+    parser.add_argument('--count', default=100, type=int, help="number of graphs")
+    parser.add_argument('--out', default='graphs', type=str, help="output directory")
+    parser.add_argument('--format', default='graph', choices=['graph', 'npz'])
+    parser.add_argument('--seed', default=None, type=int, help="root seed of the corpus")
+    parser.add_argument('--jobs', default=None, type=int, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+    spec = load_spec(args.spec)
+    feasibility = check_spec(spec)
+    if not feasibility.feasible:
+        print(describe(feasibility))
+        return 2
+    written = run_batch(spec, args.count, args.out, args.format, args.seed, args.jobs)
+    return 0 if written == args.count else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
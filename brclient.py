@@ -0,0 +1,101 @@
+#!/bin/python3
+
+## Long-lived D-Bus client of the border router (wsbrd).
+## One bus connection and one proxy are kept for the whole session. When GLib is
+## available, the client subscribes to PropertiesChanged and to the owner changes of the
+## wsbrd bus name, and Nodes is fetched again only after wsbrd reported a change or
+## restarted, or once the cached value is older than max_age in case a signal was
+## missed. Without GLib, signals cannot be received and Nodes is read on every call.
+
+import time
+
+import dbus
+
+try:
+    from dbus.mainloop.glib import DBusGMainLoop
+    from gi.repository import GLib
+except ImportError:
+    DBusGMainLoop = None
+
+BUS_NAME = 'com.silabs.Wisun.BorderRouter'
+OBJECT_PATH = '/com/silabs/Wisun/BorderRouter'
+PROPERTIES_IFACE = 'org.freedesktop.DBus.Properties'
+
+class BorderRouterClient:
+    def __init__(self, max_age=30.0):
+        """
+        :param max_age: seconds after which Nodes is read again even without a change signal
+        """
+        self.signals = DBusGMainLoop is not None
+        self.max_age = max_age
+        self.bus = None
+        self.props = None
+        self.nodes = None
+        # incremented every time a new Nodes value is read
+        self.version = 0
+        self._stale = True
+        self._read_at = 0.0 # time.monotonic() of the last value
+        if self.signals:
+            self._context = GLib.MainContext.default()
+
+    def connect(self):
+        if self.bus is None:
+            if self.signals:
+                self.bus = dbus.SystemBus(mainloop=DBusGMainLoop())
+                self.bus.add_signal_receiver(self._on_properties_changed, 'PropertiesChanged',
+                                             PROPERTIES_IFACE, BUS_NAME, OBJECT_PATH, byte_arrays=True)
+                self.bus.watch_name_owner(BUS_NAME, self._on_owner_changed)
+            else:
+                self.bus = dbus.SystemBus()
+        if self.props is None:
+            # with a main loop, the proxy follows wsbrd across restarts; without one it
+            # is bound to the running instance and created again after an error
+            proxy = self.bus.get_object(BUS_NAME, OBJECT_PATH, introspect=False,
+                                        follow_name_owner_changes=self.signals)
+            self.props = dbus.Interface(proxy, dbus_interface=PROPERTIES_IFACE)
+
+    def poll(self):
+        """
+        Dispatch the pending D-Bus signals without blocking
+        """
+        if self.signals:
+            while self._context.pending():
+                self._context.iteration(False)
+
+    def get_nodes(self):
+        """
+        Nodes property of the border router, read again only if it may have changed
+        :raise dbus.exceptions.DBusException: border router not reachable or not ready
+        """
+        self.poll()
+        if not self._stale and self.signals and time.monotonic() - self._read_at < self.max_age:
+            return self.nodes
+        try:
+            self.connect()
+            # addresses as bytes rather than arrays of dbus.Byte, for eui64.decode_nodes
+            nodes = self.props.Get(BUS_NAME, 'Nodes', byte_arrays=True)
+        except dbus.exceptions.DBusException:
+            self.props = None
+            self._stale = True
+            raise
+        if nodes != self.nodes:
+            self.nodes = nodes
+            self.version += 1
+        self._read_at = time.monotonic()
+        self._stale = False
+        return self.nodes
+
+    def _on_properties_changed(self, interface, changed, invalidated):
+        if 'Nodes' in changed:
+            # the new value comes with the signal
+            self.nodes = changed['Nodes']
+            self.version += 1
+            self._read_at = time.monotonic()
+            self._stale = False
+        elif 'Nodes' in invalidated:
+            self._stale = True
+
+    def _on_owner_changed(self, owner):
+        # wsbrd stopped ('') or started again
+        self.nodes = None
+        self._stale = True
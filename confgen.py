@@ -1,24 +1,9 @@
 #!/bin/python3
 
-def configure(num_nodes, edges, dir, cleanup, add_tun, tunip, log_nano, log_radio, be_logged_nodes, options):
-    config = ""
-
-    config += "#!/bin/bash\n"
-    if cleanup:
-        config += "rm -rf /tmp/wsbrd/\nrm -f /tmp/sim_socket /tmp/*_pae_*\nrm -f /tmp/n{1,2,3,4,5,6,7,8,9,10}*\nmkdir -p /tmp/wsbrd/\n"
+import re
 
-    config += f"cd {dir}\n"
-    # Run tun
-    if add_tun:
-        # enable core generation
-        if tunip == None:
-            tunip = "fd12:3456::2e99:8528:350:bbb7/64"
-        config += "sudo ip tuntap add mode tun tun0 user $(whoami)\n"
-        config += f"sudo ip addr add {tunip} dev tun0\n"
-        config += "sudo ip link set tun0 up\n"
-
-    # Creating D-Bus rule file for wsbrd which is necessary when it is executed as root
-    content="""
+# Creating D-Bus rule file for wsbrd which is necessary when it is executed as root
+DBUS_CONF_SCRIPT = """
 WSBRD_DBUS_CONF_FILE=/etc/dbus-1/system.d/com.silabs.Wisun.BorderRouter.conf
 
 WSBRD_DBUS_CONF_FILE_CONTENT=$(cat <<EOF
@@ -45,40 +30,178 @@ if [ ! -f "$WSBRD_DBUS_CONF_FILE" ]; then
 	echo $WSBRD_DBUS_CONF_FILE_CONTENT | sudo tee -a $WSBRD_DBUS_CONF_FILE
 fi
 """
-    config += content
 
-    # process edges, create TPG
-    tpg = ""
-    for e in edges:
-        n1 = e[0]
-        n2 = e[1]
-        tpg += f"-g {n1},{n2} "
-
-    # run server
-    config += f"gnome-terminal --tab -- {dir}/wssimserver {tpg} /tmp/sim_socket --dump -f\n"
-    config += "sleep 0.5\n"
-
-    # run phy/mac
-    for i in range(num_nodes):
-        hex_i = f"{i:04x}"
-        print(hex_i)
-        if (log_radio and str(i) in be_logged_nodes) or (log_radio and be_logged_nodes == []):
-            config += f"gnome-terminal --tab --title \"MAC_N {i}\" --  bash -c \" {dir}/wshwsim -m 01:02:03:04:05:06:{hex_i[0:2]}:{hex_i[2:4]} /tmp/uart{i} /tmp/sim_socket\"\n"
-        else:
-            config += f"gnome-terminal --tab -- sh -c \"{dir}/wshwsim -m 01:02:03:04:05:06:{hex_i[0:2]}:{hex_i[2:4]} /tmp/uart{i} /tmp/sim_socket > /dev/null 2> /dev/null\"\n"
+CLEANUP_SCRIPT = "rm -rf /tmp/wsbrd/\nrm -f /tmp/sim_socket /tmp/*_pae_*\nrm -f /tmp/n{1,2,3,4,5,6,7,8,9,10}*\nmkdir -p /tmp/wsbrd/\n"
 
-    # Run Router nodes
-    for i in range(1, num_nodes):
-        if (log_nano and str(i) in be_logged_nodes) or (log_nano and be_logged_nodes == []):
-            config += f"gnome-terminal --window --title \"R_N {i}\" -- {dir}/wsnode -F {dir}/examples/wsnode.conf -u $(readlink \"/tmp/uart{i}\") -o storage_prefix=/tmp/n{i}_\n"
+DEFAULT_TUNIP = "fd12:3456::2e99:8528:350:bbb7/64"
+
+class RunPaths:
+    """
+    Socket, UARTs, storage and TUN interface of one simulation instance, so that several
+    instances can run side by side. The empty run ID is the single instance layout
+    (/tmp/sim_socket, /tmp/uart{i}, tun0...).
+    """
+    def __init__(self, run_id=""):
+        # the TUN name "tun_<run ID>" must fit in the 15 characters of an interface name
+        if run_id != "" and not re.fullmatch(r"[A-Za-z0-9_-]{1,11}", run_id):
+            raise ValueError("Run ID must be 1 to 11 letters, digits, '_' or '-'")
+        self.run_id = run_id
+        if run_id == "":
+            self.root = "/tmp"
+            self.tun = "tun0"
         else:
-            config += f"sh -c \"{dir}/wsnode -F {dir}/examples/wsnode.conf -u $(readlink \"/tmp/uart{i}\") -o storage_prefix=/tmp/n{i}_ > /dev/null 2> /dev/null &\"\n"
+            self.root = f"/tmp/gmnsim_{run_id}"
+            self.tun = f"tun_{run_id}"
+        self.sim_socket = f"{self.root}/sim_socket"
+        self.wsbrd_storage = f"{self.root}/wsbrd/"
+
+    def uart(self, i):
+        return f"{self.root}/uart{i}"
 
-    # Run BR
-    config += f"gnome-terminal --window --title \"BR N0\" -- sudo {dir}/wsbrd -F {dir}/examples/wsbrd.conf -u $(readlink /tmp/uart0)\n"
+    def node_storage(self, i):
+        return f"{self.root}/n{i}_"
 
+    def cleanup_script(self):
+        if self.run_id == "":
+            return CLEANUP_SCRIPT
+        return f"rm -rf {self.root}\nmkdir -p {self.wsbrd_storage}\n"
+
+    def wsbrd_args(self):
+        """
+        Options pointing wsbrd to the instance TUN and storage, none for the default layout
+        """
+        if self.run_id == "":
+            return []
+        return ["-o", f"tun_device={self.tun}", "-o", f"storage_prefix={self.wsbrd_storage}"]
+
+def tun_script(tunip, tun="tun0"):
+    if tunip == None:
+        tunip = DEFAULT_TUNIP
+    config = f"sudo ip tuntap add mode tun {tun} user $(whoami)\n"
+    config += f"sudo ip addr add {tunip} dev {tun}\n"
+    config += f"sudo ip link set {tun} up\n"
     return config
 
+def tpg_args(edges):
+    """
+    wssimserver arguments describing the topology, one "-g n1,n2" per edge
+    """
+    args = []
+    for e in edges:
+        args += ["-g", f"{e[0]},{e[1]}"]
+    return args
+
+def node_mac(i):
+    hex_i = f"{i:04x}"
+    return f"01:02:03:04:05:06:{hex_i[0:2]}:{hex_i[2:4]}"
+
+def logged_nodes(be_logged_nodes):
+    """
+    Node indices of the log selection, empty or invalid entries ("1,5,", "1-3") are skipped
+    """
+    return {int(n) for n in be_logged_nodes if str(n).strip().isdigit()}
+
+def is_logged(i, enabled, be_logged_nodes):
+    """
+    Output of node i is shown when logging is enabled and the node is selected,
+    an empty selection means all the nodes
+    """
+    return bool(enabled) and (be_logged_nodes == [] or i in logged_nodes(be_logged_nodes))
+
+def node_ranges(nodes):
+    """
+    Compress node indices into ranges: ['1', '5', '6', '7'] -> [(1, 1), (5, 7)]
+    """
+    ranges = []
+    for i in sorted(logged_nodes(nodes)):
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1] = (ranges[-1][0], i)
+        else:
+            ranges.append((i, i))
+    return ranges
+
+def logged_ranges(enabled, be_logged_nodes, num_nodes):
+    """
+    Nodes whose output is shown, as a bash word list of "first-last" ranges
+    """
+    if not enabled:
+        return ""
+    if be_logged_nodes == []:
+        return f"0-{num_nodes - 1}"
+    return " ".join(f"{lo}-{hi}" for lo, hi in node_ranges(be_logged_nodes))
+
+# Per-node commands of the runscript, looped over the nodes so that the script size does
+# not depend on the number of nodes. in_ranges tests a node against a LOG_* range list.
+NODES_SCRIPT = """
+in_ranges() {
+	local r
+	for r in $2; do
+		if [ "$1" -ge "${r%-*}" ] && [ "$1" -le "${r#*-}" ]; then return 0; fi
+	done
+	return 1
+}
+
+# run server
+TPG=()
+for e in $EDGES; do TPG+=(-g "$e"); done
+gnome-terminal --tab -- "$SIM_DIR/wssimserver" "${TPG[@]}" "$SIM_SOCKET" --dump -f
+sleep 0.5
+
+# run phy/mac
+for ((i = 0; i < NUM_NODES; i++)); do
+	MAC=$(printf "01:02:03:04:05:06:%02x:%02x" $((i >> 8 & 255)) $((i & 255)))
+	if in_ranges $i "$LOG_RADIO"; then
+		gnome-terminal --tab --title "MAC_N $i" -- bash -c " $SIM_DIR/wshwsim -m $MAC $RUN_DIR/uart$i $SIM_SOCKET"
+	else
+		gnome-terminal --tab -- sh -c "$SIM_DIR/wshwsim -m $MAC $RUN_DIR/uart$i $SIM_SOCKET > /dev/null 2> /dev/null"
+	fi
+done
+
+# Run Router nodes
+for ((i = 1; i < NUM_NODES; i++)); do
+	if in_ranges $i "$LOG_NANO"; then
+		gnome-terminal --window --title "R_N $i" -- "$SIM_DIR/wsnode" -F "$SIM_DIR/examples/wsnode.conf" -u "$(readlink "$RUN_DIR/uart$i")" -o storage_prefix=$RUN_DIR/n${i}_
+	else
+		"$SIM_DIR/wsnode" -F "$SIM_DIR/examples/wsnode.conf" -u "$(readlink "$RUN_DIR/uart$i")" -o storage_prefix=$RUN_DIR/n${i}_ > /dev/null 2> /dev/null &
+	fi
+done
+
+# Run BR
+gnome-terminal --window --title "BR N0" -- sudo "$SIM_DIR/wsbrd" -F "$SIM_DIR/examples/wsbrd.conf" -u "$(readlink "$RUN_DIR/uart0")" "${BR_OPTS[@]}"
+"""
+
+def configure(num_nodes, edges, dir, cleanup, add_tun, tunip, log_nano, log_radio, be_logged_nodes, options):
+    """
+    Runscript of a simulation
+    :param options: None or dict, 'run_id' selects the instance namespace (see RunPaths)
+    """
+    paths = RunPaths((options or {}).get('run_id', ""))
+    parts = ["#!/bin/bash\n"]
+    if cleanup:
+        parts.append(paths.cleanup_script())
+    elif paths.run_id != "":
+        parts.append(f"mkdir -p {paths.wsbrd_storage}\n")
+
+    parts.append(f"cd {dir}\n")
+    # Run tun
+    if add_tun:
+        parts.append(tun_script(tunip, paths.tun))
+
+    parts.append(DBUS_CONF_SCRIPT)
+
+    # Simulation parameters, the topology is the only part growing with the graph
+    parts.append(f'\nSIM_DIR="{dir}"\n')
+    parts.append(f"NUM_NODES={num_nodes}\n")
+    parts.append(f'RUN_DIR="{paths.root}"\n')
+    parts.append(f'SIM_SOCKET="{paths.sim_socket}"\n')
+    parts.append("BR_OPTS=(" + " ".join(paths.wsbrd_args()) + ")\n")
+    parts.append(f'LOG_RADIO="{logged_ranges(log_radio, be_logged_nodes, num_nodes)}"\n')
+    parts.append(f'LOG_NANO="{logged_ranges(log_nano, be_logged_nodes, num_nodes)}"\n')
+    parts.append('EDGES="' + " ".join(f"{e[0]},{e[1]}" for e in edges) + '"\n')
+
+    parts.append(NODES_SCRIPT)
+    return "".join(parts)
+
 # Example
 #edg = [[1, 2, 9, 10], [2, 3, 9, 10], [1, 3, 9, 10]]
 #conf = configure(3, edg, "/home/mahboob/test/mse-tm-mbed-simulator", True, True, None, None)
\ No newline at end of file
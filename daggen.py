@@ -1,10 +1,16 @@
 import random,math,argparse
 import numpy as np
-from numpy.random.mtrand import sample
-from  matplotlib  import  patches , pyplot  as  plt
-import networkx as nx
-from scipy import sparse
-from networkx.drawing.nx_agraph import graphviz_layout
+
+from adjindex import AdjacencyIndex
+from eui64 import NodeTable, node_labels, root_index
+from lazyimport import LazyModule
+from treelayout import tidy_tree_layout
+
+# Only needed for plotting
+plt = LazyModule('matplotlib.pyplot')
+nx = LazyModule('networkx')
+# Only needed for get_graph_diameter
+eccentricity = LazyModule('eccentricity')
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--mode', default='default', type=str)       #parameters setting
@@ -12,7 +18,8 @@ parser.add_argument('--n', default=10, type=int)                 #number of DAG
 parser.add_argument('--max_out', default=2, type=float)          #max out_degree of one node
 parser.add_argument('--alpha',default=1,type=float)              #shape 
 parser.add_argument('--beta',default=1.0,type=float)             #regularity
-args = parser.parse_args()
+# Defaults only, the command line is parsed when daggen runs as a script
+args = parser.parse_args([])
 
 set_dag_size  = [ 20 , 30 , 40 , 50 , 60 , 70 , 80 , 90 ]              #random number of DAG nodes       
 set_max_out = [1,2,3,4,5]                                              #max out_degree of one node
@@ -110,6 +117,71 @@ def DAGs_generate(mode = 'default', n = 10, max_out = 2,alpha = 1,beta = 1.0):
     #############################################plot###################################################
     return edges,into_degree,out_degree,position
 
+def sample_distinct_columns(rng, counts, pool_sizes):
+    '''
+    For every row r pick counts[r] distinct columns out of range(pool_sizes[r]), uniformly at random.
+    Floyd's sampling algorithm run on all rows at once, so the cost is O(rows * max(counts)^2)
+    numpy work whatever the pool sizes are.
+    :param rng: numpy.random.Generator
+    :param counts: number of columns wanted per row (clipped to the pool size)
+    :param pool_sizes: number of columns to choose from, per row or a scalar for all rows
+    :return: rows, cols int32 arrays, grouped by row
+    '''
+    pool_sizes = np.broadcast_to(np.asarray(pool_sizes, dtype=np.int64), np.shape(counts))
+    counts = np.clip(np.asarray(counts, dtype=np.int64), 0, pool_sizes)
+    kmax = int(counts.max()) if len(counts) else 0
+    chosen = np.empty((len(counts), kmax), dtype=np.int64)
+    for m in range(kmax):
+        j = pool_sizes - counts + m
+        t = (rng.random(len(counts)) * (j + 1)).astype(np.int64)
+        taken = (chosen[:, :m] == t[:, None]).any(axis=1)
+        chosen[:, m] = np.where(taken, j, t)
+    mask = np.arange(kmax) < counts[:, None]
+    return np.nonzero(mask)[0].astype(np.int32), chosen[mask].astype(np.int32)
+
+def DAGs_generate_arrays(n=10, max_out=2, alpha=1, beta=1.0, rng=None):
+    '''
+    Vectorized counterpart of DAGs_generate with the same alpha/beta/max_out semantics.
+    Layer sizes are fixed up with one bincount/hypergeometric draw, and out-degrees and
+    children of all nodes are drawn at once, without Python-level loops over nodes or layers.
+    Nothing is written to the module-level args.
+    Throughput target: at least 10x DAGs_generate on 10k nodes.
+    :param rng: numpy.random.Generator, or a seed for numpy.random.default_rng
+    :return: src, dst int32 arrays of edges (node 0 is the entry node)
+             layer_sizes number of nodes in each layer, layer i holds the consecutive
+             ids starting at 1 + sum(layer_sizes[:i])
+    '''
+    rng = np.random.default_rng(rng)
+    max_out = int(max_out)
+    length = min(max(math.floor(math.sqrt(n)/alpha), 1), n)
+    sizes = np.ceil(rng.normal(loc=n/length, scale=beta, size=length)).astype(np.int64)
+    np.maximum(sizes, 0, out=sizes)
+
+    # Same fix-up as DAGs_generate: spread missing nodes over random layers, or
+    # remove extra nodes from random layers while keeping at least one node in each
+    diff = n - int(sizes.sum())
+    if diff > 0:
+        sizes += np.bincount(rng.integers(0, length, size=diff), minlength=length)
+    elif diff < 0:
+        sizes -= rng.multivariate_hypergeometric(np.maximum(sizes - 1, 0), -diff)
+
+    first = np.concatenate(([1], 1 + np.cumsum(sizes)))
+    # Every node draws its out-degree and its children in the next layer (none for the last layer)
+    layer = np.repeat(np.arange(length), sizes)
+    next_size = np.append(sizes[1:], 0)[layer]
+    out_degree = rng.integers(1, max_out + 1, size=n)
+    rows, cols = sample_distinct_columns(rng, out_degree, next_size)
+    src = [rows + 1]
+    dst = [cols + first[layer[rows] + 1]]
+
+    # Add entry node as father to all nodes without edges
+    into_degree = np.bincount(dst[0], minlength=n+1)[1:]
+    orphans = np.flatnonzero(into_degree == 0) + 1
+    src.append(np.zeros(len(orphans), dtype=np.int32))
+    dst.append(orphans)
+    return (np.concatenate(src).astype(np.int32), np.concatenate(dst).astype(np.int32),
+            sizes.astype(np.int32))
+
 def plot_dag(edges,postion):
     g1 = nx.DiGraph()
     g1.add_edges_from(edges)
@@ -133,51 +205,62 @@ def plot_dag(edges,postion):
     plt.show()
 
 
-def plot_dag_as_tree(edges, postion=False, dag=False):
-    G = nx.from_edgelist(edges)
-    DG = nx.DiGraph()
-    root = '32345600'
-    queue = [root]
-    explored = set([root])
-
-    while queue:
-        node = queue.pop(0)
-        for neighbor in G.neighbors(node):
-            if neighbor not in explored:
-                explored.add(neighbor)
-                queue.append(neighbor)
-                # add directed edge to the auxiliary graph
-                if node not in DG:
-                    DG.add_node(node)
-                if neighbor not in DG:
-                    DG.add_node(neighbor)
-                if neighbor in queue:
-                    DG.add_edge(node, neighbor)
-                else:
-                    DG.add_edge(neighbor, node)
-    
-    plt.title('RPL Tree')
-    pos=graphviz_layout(DG, prog='dot')
-    # Get only the last part of the node name
-    labeldict = {}
-    for i in edges:
-        labeldict[i[0]] = int(i[0][6:7]) * 256 + int(i[0][7:])
-    # asign the root node the label 'BR'
-    if (len(edges) > 0):
-        labeldict['32345600'] = 'BR'
+# Spacing of the native tree layout, in points like graphviz 'dot' uses
+TREE_NODE_SEP = 72
+TREE_RANK_SEP = 72
+
+def tree_positions(parent, root):
+    '''
+    Lay out the tree rooted at root in-process, no graphviz involved
+    :param parent: parent index of every node, -1 for the roots
+    :return: (n, 2) array of positions following the 'dot' conventions (points, y upwards,
+             root on top), NaN for the nodes not under root
+    '''
+    return dot_positions(tidy_tree_layout(parent, root))
+
+def dot_positions(xy):
+    '''
+    Scale a tidy_tree_layout (x, depth) array to the 'dot' conventions, in a new array
+    '''
+    xy = np.array(xy, dtype=float)
+    xy[:, 0] = 27 + xy[:, 0] * TREE_NODE_SEP
+    xy[:, 1] = 27 + (np.nanmax(xy[:, 1]) - xy[:, 1]) * TREE_RANK_SEP
+    return xy
+
+def plot_dag_as_tree(keys, parent, postion=False, dag=False):
+    '''
+    RPL tree reported by the border router
+    :param keys: EUI-64 keys of the nodes, parent: parent index of every node (see eui64.decode_nodes)
+    :return: positions array if postion, DiGraph of node labels if dag
+    '''
+    table = NodeTable(keys, parent, len(keys))
+    root = root_index(table)
+    if root < 0:
+        return None
+    xy = tree_positions(parent, root)
     if postion == True:
-        # scale poses:
-        return pos
+        return xy
+    labels = node_labels(keys).tolist()
+    placed = ~np.isnan(xy[:, 0])
+    tree_edges = [(p, v) for v, p in enumerate(parent.tolist()) if p >= 0 and placed[v]]
     if dag == True:
-        labeldict['32345600'] = 0
         new_dag = nx.DiGraph()
-        for u, v in DG.edges():
-            new_u = labeldict[u]
-            new_v = labeldict[v]
-            # Add the new edge to the new graph
-            new_dag.add_edge(new_u, new_v)
+        new_dag.add_edges_from((labels[u], labels[v]) for u, v in tree_edges)
         return new_dag
+    # Label nodes with their index, asign the root node the label 'BR'
+    labeldict = {i: labels[i] for i in np.flatnonzero(placed).tolist()}
+    labeldict[root] = 'BR'
 
+    DG = nx.DiGraph()
+    DG.add_nodes_from(labeldict)
+    DG.add_edges_from(tree_edges)
+    plt.title('RPL Tree')
+    # pygraphviz is optional, only used for this static plot when it is installed
+    try:
+        from networkx.drawing.nx_agraph import graphviz_layout
+        pos = graphviz_layout(DG, prog='dot')
+    except ImportError:
+        pos = {i: xy[i] for i in labeldict}
     nx.draw(DG, pos, labels=labeldict, arrows=False)
     plt.show()
 
@@ -195,96 +278,109 @@ def get_pos_dag(edges):
     return pos
 
 def get_graph_diameter(edges):
-    G = nx.Graph()
-    G.add_edges_from(edges)
-    return nx.diameter(G)
+    return eccentricity.graph_eccentricity(edges).diameter
 
 def search_for_successors(node, edges):
         '''
         find successor node
         :param node: the node id to be searched
-        :param edges: DAG edge information (Note that it is better to pass the value of the list (edges[:]) instead of the address of the list (edges)!!!)
+        :param edges: DAG edge information, or a prebuilt AdjacencyIndex
         :return: node's follow-up node id list
         '''
-        map = {}
         if node == 'Exit': return print("error, 'Exit' node do not have successors!")
-        for  i  in  range ( len ( edges )):
-            if edges[i][0] in map.keys():
-                map[edges[i][0]].append(edges[i][1])
-            else:
-                map[edges[i][0]] = [edges[i][1]]
-        pred = map[node]
-        return pred
+        return _as_index(edges).successors(node)
 
 def search_for_all_successors(node, edges):
-    save = node
-    node = [node]
-    for ele in node:
-        succ = search_for_successors(ele,edges)
-        if(len(succ)==1 and succ[0]=='Exit'):
-            break
-        for item in succ:
-            if item in node:
-                continue
-            else:
-                node.append(item)
-    node.remove(save)
-    return node
+    '''
+    Find all the nodes reachable from node, with a single BFS over the adjacency index
+    :param edges: DAG edge information, or a prebuilt AdjacencyIndex
+    :return: node id list in BFS order
+    '''
+    return _as_index(edges).descendants(node)
+
+def search_for_all_predecessors(node, edges):
+    '''
+    Find all the nodes node can be reached from, with a single BFS over the adjacency index
+    '''
+    return _as_index(edges).ancestors(node)
 
 
 def search_for_predecessor(node, edges):
     '''
     Find the predecessor node
     :param node: the node id to be searched
-    :param edges: DAG edge information
+    :param edges: DAG edge information, or a prebuilt AdjacencyIndex
     :return: node's predecessor node id list
     '''
-    map = {}
     if node == '0': return print("error, '0' node do not have predecessor!")
-    for  i  in  range ( len ( edges )):
-        if edges[i][1] in map.keys():
-            map[edges[i][1]].append(edges[i][0])
-        else:
-            map[edges[i][1]] = [edges[i][0]]
-    succ = map[node]
-    return succ
+    return _as_index(edges).predecessors(node)
+
+def _as_index(edges):
+    return edges if isinstance(edges, AdjacencyIndex) else AdjacencyIndex(edges)
 ##### for my graduation project
 
 
-def workflows_generator(mode='default', n=10, max_out=2, alpha=1, beta=1.0, t_unit=10, resource_unit=100):
+# One record per task, filled by task_attributes
+TASK_DTYPE = np.dtype([('duration', np.int32), ('cpu', np.float64), ('mem', np.float64)])
+
+def task_attributes(n, rng=None, t_unit=10, resource_unit=100, prob=1):
+    '''
+    Draw the duration and (CPU, Memory) requirements of n tasks with a single vectorized call.
+    Same distributions as workflows_generator: with probability prob a task lasts [0, 3t),
+    otherwise [5t, 10t); half of the tasks are CPU heavy, the other half memory heavy.
+    :param rng: numpy.random.Generator, or a seed for numpy.random.default_rng
+    :return: structured array of TASK_DTYPE
+    '''
+    rng = np.random.default_rng(rng)
+    t = t_unit
+    r = resource_unit
+    u = rng.random((5, n))
+    tasks = np.empty(n, dtype=TASK_DTYPE)
+    tasks['duration'] = np.where(u[0] < prob, np.floor(u[1] * 3 * t), 5 * t + np.floor(u[1] * 5 * t))
+    heavy = 0.25 * r + u[2] * 0.25 * r
+    light = 0.05 * r + u[3] * (0.01 * r - 0.05 * r)
+    cpu_heavy = u[4] < 0.5
+    tasks['cpu'] = np.where(cpu_heavy, heavy, light)
+    tasks['mem'] = np.where(cpu_heavy, light, heavy)
+    return tasks
+
+def workflows_generator(mode='default', n=10, max_out=2, alpha=1, beta=1.0, t_unit=10, resource_unit=100, plot=True):
     '''
     Randomly generate a DAG task and randomly assign its duration and (CPU, Memory) requirements
     :param mode: DAG is generated by default parameters
     :param n: number of tasks in the DAG
     :para max_out: The maximum number of child nodes of a DAG node
+    :param plot: show the DAG with matplotlib (blocks until the window is closed)
     :return: edges DAG edge information
              duration DAG node duration
              demand DAG node resource requirement quantity
              position position in the drawing
     '''
-    t = t_unit  # s   time unit
-    r = resource_unit  # resource unit
     edges, in_degree, out_degree, position = DAGs_generate(mode, n, max_out, alpha, beta)
-    plot_dag(edges,position)
-    duration = []
-    demand = []
-    # Initialize duration
-    for  i  in  range ( len ( in_degree )):
-        if random.random() < args.prob:
-            # duration.append(random.uniform(t,3*t))
-            duration.append(random.sample(range(0, 3 * t), 1)[0])
-        else:
-            # duration.append(random.uniform(5*t,10*t))
-            duration.append(random.sample(range(5 * t, 10 * t), 1)[0])
-    # Initialize resource requirements
-    for  i  in  range ( len ( in_degree )):
-        if random.random() < 0.5:
-            demand.append((random.uniform(0.25 * r, 0.5 * r), random.uniform(0.05 * r, 0.01 * r)))
-        else:
-            demand.append((random.uniform(0.05 * r, 0.01 * r), random.uniform(0.25 * r, 0.5 * r)))
-
+    if plot:
+        plot_dag(edges,position)
+    # Seeded from the global random state, so random.seed() keeps results reproducible
+    rng = np.random.default_rng(random.getrandbits(64))
+    tasks = task_attributes(len(in_degree), rng, t_unit, resource_unit, args.prob)
+    duration = tasks['duration'].tolist()
+    demand = list(zip(tasks['cpu'].tolist(), tasks['mem'].tolist()))
     return edges, duration, demand, position
 
+def workflows_generate_batch(count, n=10, max_out=2, alpha=1, beta=1.0, t_unit=10, resource_unit=100, prob=1, rng=None):
+    '''
+    Generate count annotated workload DAGs for load studies, without plotting.
+    The attributes of all count * n tasks are drawn in one call.
+    :return: list of (src, dst, tasks), src/dst int32 edge arrays and tasks a TASK_DTYPE array
+             whose record i belongs to node i+1
+    '''
+    rng = np.random.default_rng(rng)
+    tasks = task_attributes(count * n, rng, t_unit, resource_unit, prob).reshape(count, n)
+    workflows = []
+    for i in range(count):
+        src, dst, _ = DAGs_generate_arrays(n, max_out, alpha, beta, rng)
+        workflows.append((src, dst, tasks[i]))
+    return workflows
+
 
 # Example
 # Parameters:
@@ -302,7 +398,11 @@ def workflows_generator(mode='default', n=10, max_out=2, alpha=1, beta=1.0, t_un
 #    if "Exit" not in edge:
 #        print ("-g ", edge[0],",",edge[1], end=" ", sep="")
 
-def random_mesh_graph_gen(num_nodes, max_out, alpha, beta):
-    edges, duration, demand, position = DAGs_generate('default',num_nodes,max_out,alpha,beta)
-    #plot_dag(edges,position)
-    return edges
+def random_mesh_graph_gen(num_nodes, max_out, alpha, beta, rng=None):
+    src, dst, _ = DAGs_generate_arrays(num_nodes, max_out, alpha, beta, rng)
+    return list(zip(src.tolist(), dst.tolist()))
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    edges, duration, demand, position = workflows_generator(args.mode, args.n, args.max_out, args.alpha, args.beta)
+    print(edges)
@@ -0,0 +1,51 @@
+#!/bin/python3
+
+## Integer EUI-64 node IDs for the topology reported by the border router.
+## wsbrd reports each node as (EUI-64, {'parent': EUI-64, ...}). The 8 bytes are read
+## as one big-endian integer key. The simulator numbers the nodes in the 2 last bytes
+## of their MAC, so key & 0xFFFF is the node index of the graph (0 is the border router).
+
+from collections import namedtuple
+import numpy as np
+
+# keys: uint64 EUI-64 of every node, the border router included, sorted
+# parent: int32 index in keys of the parent of every node, -1 for the root
+# reported: number of nodes in the Nodes property
+NodeTable = namedtuple('NodeTable', ['keys', 'parent', 'reported'])
+
+LABEL_MASK = np.uint64(0xFFFF)
+
+def decode_nodes(nodes):
+    """
+    Convert the Nodes property of wsbrd in one pass.
+    Parents missing from the list (the border router) are added as roots.
+    :return: NodeTable
+    """
+    if len(nodes) == 0:
+        return NodeTable(np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int32), 0)
+    keys = np.frombuffer(b"".join(bytes(n[0]) for n in nodes), dtype='>u8')
+    has_parent = np.fromiter(('parent' in n[1] for n in nodes), dtype=bool, count=len(nodes))
+    parent_keys = np.frombuffer(b"".join(bytes(n[1]['parent']) for n in nodes if 'parent' in n[1]), dtype='>u8')
+    all_keys = np.unique(np.concatenate((keys, parent_keys))).astype(np.uint64)
+    parent = np.full(len(all_keys), -1, dtype=np.int32)
+    parent[np.searchsorted(all_keys, keys[has_parent])] = np.searchsorted(all_keys, parent_keys)
+    return NodeTable(all_keys, parent, len(nodes))
+
+def node_labels(keys):
+    """
+    Node index in the graph of each EUI-64 key
+    """
+    return (np.asarray(keys, dtype=np.uint64) & LABEL_MASK).astype(np.int64)
+
+def root_index(table):
+    """
+    Index of the border router: the root labelled 0, else the first root, -1 if empty
+    """
+    roots = np.flatnonzero(table.parent < 0)
+    if len(roots) == 0:
+        return -1
+    br = roots[node_labels(table.keys[roots]) == 0]
+    return int(br[0] if len(br) else roots[0])
+
+def format_eui64(key):
+    return ":".join(f"{b:02x}" for b in int(key).to_bytes(8, "big"))
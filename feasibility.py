@@ -0,0 +1,112 @@
+#!/bin/python3
+
+## Exact feasibility of the random graph generation parameters.
+## Managed mode builds the layers of random_dag from num_nodes - 1 nodes (node 0 is the
+## border router); a solution exists iff the layer sizes allowed by the bounds can add up
+## to that number, which only depends on the extreme sums: no search needed.
+
+import math
+from collections import namedtuple
+
+Feasibility = namedtuple('Feasibility', ['feasible', 'reason', 'suggestions'])
+
+def layer_sum_range(num_layers, min_npl, max_npl, num_first_layer, accurate=True):
+    """
+    Smallest and largest total number of nodes the layers can hold
+    """
+    if accurate:
+        return (num_first_layer + (num_layers - 1) * min_npl,
+                num_first_layer + (num_layers - 1) * max_npl)
+    return num_layers * min_npl, num_layers * max_npl
+
+def check_managed_params(num_nodes, num_layers, min_npl, max_npl, num_first_layer, accurate=True):
+    """
+    Decide whether random_dag has a solution for these parameters, in constant time.
+    When it has none, suggest the closest feasible value of each parameter taken alone.
+    :return: Feasibility(feasible, reason, suggestions), suggestions is a list of
+             (parameter name, value) sorted by relative change
+    """
+    if num_nodes < 2:
+        return Feasibility(False, "At least 2 nodes are needed (the border router and one node).", [('nodes', 2)])
+    if num_layers < 1:
+        return Feasibility(False, "At least 1 layer is needed.", [('layers', 1)])
+    if min_npl < 1:
+        return Feasibility(False, "Min(N/L) must be at least 1, otherwise nodes can be left without parent.",
+                           [('min_per_layer', 1)])
+    if max_npl < min_npl:
+        return Feasibility(False, "Max(N/L) must not be smaller than Min(N/L).",
+                           [('max_per_layer', min_npl), ('min_per_layer', max_npl)])
+    if num_first_layer < 1:
+        return Feasibility(False, "N/L1 must be at least 1.", [('first_layer', 1)])
+
+    m = num_nodes - 1
+    lo, hi = layer_sum_range(num_layers, min_npl, max_npl, num_first_layer, accurate)
+    if lo <= m <= hi:
+        if num_layers == 1 and m != num_first_layer:
+            # the only layer is the first one, it cannot hold other than N/L1 nodes
+            return Feasibility(False, f"With 1 layer, N/L1 is the whole layer: {m} nodes "
+                               f"(without the border router) are requested but N/L1 is {num_first_layer}.",
+                               [('first_layer', m)] + ([('nodes', num_first_layer + 1)]
+                                                       if lo <= num_first_layer <= hi else []))
+        return Feasibility(True, "", [])
+
+    reason = f"{num_layers} layers can hold {lo} to {hi} nodes, but {m} nodes (without the border router) are requested."
+    candidates = [('nodes', min(max(m, lo), hi) + 1)]
+    # The other parameters, solved for lo <= m <= hi one at a time
+    if accurate:
+        rest = m - num_first_layer
+        if num_layers > 1 and rest > 0:
+            layers = _closest_in_range(num_layers, 1 + math.ceil(rest / max_npl), 1 + rest // min_npl)
+            if layers is not None:
+                candidates.append(('layers', layers))
+            if m > hi:
+                candidates.append(('max_per_layer', math.ceil(rest / (num_layers - 1))))
+            elif rest // (num_layers - 1) >= 1:
+                candidates.append(('min_per_layer', rest // (num_layers - 1)))
+        first = _closest_in_range(num_first_layer, max(1, m - (num_layers - 1) * max_npl), m - (num_layers - 1) * min_npl)
+        if first is not None:
+            candidates.append(('first_layer', first))
+    else:
+        layers = _closest_in_range(num_layers, math.ceil(m / max_npl), m // min_npl)
+        if layers is not None:
+            candidates.append(('layers', layers))
+        if m > hi:
+            candidates.append(('max_per_layer', math.ceil(m / num_layers)))
+        elif m // num_layers >= 1:
+            candidates.append(('min_per_layer', m // num_layers))
+
+    current = {'nodes': num_nodes, 'layers': num_layers, 'min_per_layer': min_npl,
+               'max_per_layer': max_npl, 'first_layer': num_first_layer}
+    candidates.sort(key=lambda c: abs(c[1] - current[c[0]]) / max(current[c[0]], 1))
+    return Feasibility(False, reason, candidates)
+
+def check_semi_managed_params(num_nodes, max_out, alpha, beta):
+    """
+    DAGs_generate always finds a graph once its parameters are in range
+    """
+    if num_nodes < 1:
+        return Feasibility(False, "At least 1 node is needed.", [('nodes', 1)])
+    if max_out < 1:
+        return Feasibility(False, "Max(NBR) must be at least 1.", [('max_out', 1)])
+    if alpha <= 0:
+        return Feasibility(False, "Shape must be positive.", [('alpha', 1.0)])
+    if beta < 0:
+        return Feasibility(False, "Regularity must not be negative.", [('beta', 0.0)])
+    return Feasibility(True, "", [])
+
+def describe(result):
+    """
+    Human readable message for an infeasible result
+    """
+    if result.feasible:
+        return "Parameters are feasible."
+    lines = [result.reason]
+    if result.suggestions:
+        lines.append("Closest feasible values:")
+        lines.extend(f"  {name} = {value}" for name, value in result.suggestions)
+    return "\n".join(lines)
+
+def _closest_in_range(value, low, high):
+    if low > high:
+        return None
+    return min(max(value, low), high)
@@ -0,0 +1,92 @@
+#!/bin/python3
+
+## Layers of the mesh for the connection time report.
+## The layer of a node is its hop depth in the RPL tree: it is read from the parent map
+## reported by the border router instead of being guessed from the join times. The exact
+## 1-D optimal clustering of the join times is kept to compare with.
+
+from collections import namedtuple
+import numpy as np
+
+# Join times of the nodes at one hop depth, in seconds
+LayerStats = namedtuple('LayerStats', ['depth', 'count', 'min', 'median', 'p95'])
+
+def hop_depths(parent, root):
+    """
+    Hop depth of every node below root, in one pass over the parent map:
+    each node is visited once, on the first path from a node up to an already known depth
+    :param parent: parent index of every node, -1 for the roots
+    :return: int array, -1 for the nodes not under root (other roots, orphans, loops)
+    """
+    parent = np.asarray(parent, dtype=np.int64).tolist()
+    depth = [-2] * len(parent) # -2: not visited yet
+    if 0 <= root < len(parent):
+        depth[root] = 0
+    for v in range(len(parent)):
+        path = []
+        while depth[v] == -2:
+            depth[v] = -3 # on the current path, meeting it again means a loop
+            path.append(v)
+            v = parent[v]
+            if v < 0:
+                break
+        d = depth[v] if v >= 0 and depth[v] != -3 else -1
+        for w in reversed(path):
+            d = d + 1 if d >= 0 else -1
+            depth[w] = d
+    return np.array(depth, dtype=np.int64)
+
+def layer_stats(depths, times):
+    """
+    Join time statistics per hop depth, the nodes with a negative depth are left out
+    :return: list of LayerStats by increasing depth
+    """
+    depths = np.asarray(depths)
+    times = np.asarray(times, dtype=float)
+    stats = []
+    for d in np.unique(depths[depths >= 0]).tolist():
+        t = times[depths == d]
+        stats.append(LayerStats(d, len(t), float(t.min()), float(np.median(t)),
+                                float(np.percentile(t, 95))))
+    return stats
+
+def optimal_1d_clusters(values, k):
+    """
+    Exact k-means of 1-D values (minimal sum of squared distances to the cluster means),
+    by dynamic programming over the sorted values, O(k n^2)
+    :return: cluster of every value (0 for the smallest values), cluster means
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    k = max(1, min(k, n))
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    order = np.argsort(values, kind='stable')
+    x = values[order]
+    s1 = np.concatenate(([0.0], np.cumsum(x)))
+    s2 = np.concatenate(([0.0], np.cumsum(x * x)))
+    def cost(j, i):
+        # squared error of the cluster x[j..i], j an array
+        count = i - j + 1
+        total = s1[i+1] - s1[j]
+        return s2[i+1] - s2[j] - total * total / count
+    # best[m, i]: least error of x[0..i] in m+1 clusters, start[m, i]: first index of the last one
+    best = np.full((k, n), np.inf)
+    start = np.zeros((k, n), dtype=np.int64)
+    best[0] = cost(np.zeros(n, dtype=np.int64), np.arange(n))
+    for m in range(1, k):
+        for i in range(m, n):
+            j = np.arange(m, i + 1)
+            errors = best[m-1, j-1] + cost(j, i)
+            a = int(np.argmin(errors))
+            best[m, i] = errors[a]
+            start[m, i] = j[a]
+    labels = np.empty(n, dtype=np.int64)
+    means = np.empty(k)
+    i = n - 1
+    for m in range(k - 1, -1, -1):
+        j = start[m, i] if m else 0
+        labels[order[j:i+1]] = m
+        means[m] = x[j:i+1].mean()
+        i = j - 1
+    return labels, means
@@ -0,0 +1,33 @@
+#!/bin/python3
+
+import importlib
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access,
+    e.g. plt = LazyModule('matplotlib.pyplot')
+    """
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self._name)
+            self.__dict__['_module'] = module
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__['_module'] is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_function(module_name, function_name):
+    """
+    Callable that imports module_name on its first call and forwards to function_name
+    """
+    def wrapper(*args, **kwargs):
+        return getattr(importlib.import_module(module_name), function_name)(*args, **kwargs)
+    wrapper.__name__ = function_name
+    wrapper.__qualname__ = function_name
+    return wrapper
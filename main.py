@@ -3,22 +3,47 @@
 import json
 import os
 import subprocess
+import threading
 import tkinter as tk
 from tkinter import filedialog as filedialog
 import time
 from tkinter import ttk
-import dbus
-from matplotlib import pyplot as plt
-import numpy as np
-from sklearn.cluster import KMeans
 
 from confgen import configure as SimConfGen
+from confgen import RunPaths
 from assets import bs64_wisun_img as GetWisunImg
-from daggen import random_mesh_graph_gen as RndMeshGen
-from daggen import plot_dag_as_tree as MeshPlotGetPosGetDag
-from daggen import get_pos_dag as RndGetPos
-from daggen import get_graph_diameter as GrphDiameter
-from managed_daggen import random_dag as MngRndMeshGen
+from feasibility import check_managed_params as CheckManagedParams
+from feasibility import check_semi_managed_params as CheckSemiManagedParams
+from feasibility import describe as DescribeFeasibility
+from lazyimport import LazyModule, lazy_function
+from procmonitor import ProcessMonitor
+from topology import TopologySampler, TopologyReplay
+from tkbridge import TkBridge
+
+# Heavy modules are loaded on first use, drawing the main window only needs tkinter
+dbus = LazyModule('dbus')
+plt = LazyModule('matplotlib.pyplot')
+np = LazyModule('numpy')
+webbrowser = LazyModule('webbrowser')
+RndMeshGen = lazy_function('daggen', 'random_mesh_graph_gen')
+MeshPlotGetPosGetDag = lazy_function('daggen', 'plot_dag_as_tree')
+RndGetPos = lazy_function('daggen', 'get_pos_dag')
+MngRndMeshGen = lazy_function('managed_daggen', 'random_dag')
+SimSupervisor = lazy_function('simsupervisor', 'SimSupervisor')
+BorderRouterClient = lazy_function('brclient', 'BorderRouterClient')
+DecodeNodes = lazy_function('eui64', 'decode_nodes')
+NodeLabels = lazy_function('eui64', 'node_labels')
+TopologyRecorder = lazy_function('recorder', 'TopologyRecorder')
+OpenRecording = lazy_function('recorder', 'Recording')
+LayoutCache = lazy_function('treelayout', 'LayoutCache')
+DotPositions = lazy_function('daggen', 'dot_positions')
+RootIndex = lazy_function('eui64', 'root_index')
+HopDepths = lazy_function('layers', 'hop_depths')
+DepthStats = lazy_function('layers', 'layer_stats')
+OptimalClusters = lazy_function('layers', 'optimal_1d_clusters')
+MeshMetrics = lazy_function('metrics', 'MeshMetrics')
+MetricsExporter = lazy_function('metrics', 'MetricsExporter')
+MakeReport = lazy_function('report', 'make_report')
 
 
 _VERSION = "0.5b"
@@ -28,64 +53,115 @@ _EBG = "#444444"
 _DBG = "#4e5552"
 
 def get_sim_nodes():
-    globalinfo.reset_connected_nodes()
+    """
+    Topology reported by the border router, only read by the topology sampler
+    :return: NodeTable of integer EUI-64 keys and parent indices (see eui64), None if not available
+    """
+    global brclient, brnodes
     if not is_sim_running():
-        return None, None
-    bus = dbus.SystemBus()
-    interface_name = 'com.silabs.Wisun.BorderRouter'
-    object_path = '/com/silabs/Wisun/BorderRouter'
-    property_name = 'Nodes'
+        return None
+    if brclient is None:
+        brclient = BorderRouterClient()
     try:
-        proxy_obj = bus.get_object(interface_name, object_path)
-    except Exception as e:
-        print("Error: Could not connect to the border router")
+        nodes = brclient.get_nodes()
+    except dbus.exceptions.DBusException as e:
+        print("Error: Could not read nodes from the border router")
         print(str(e))
         #tk.messagebox.showerror(title="D-BUS error", message="Could not connect to the border router. Is simulation running?")
-        return None, None
-    interface = dbus.Interface(proxy_obj, dbus_interface='org.freedesktop.DBus.Properties')
-    try:
-        nodes = interface.Get(interface_name, property_name)
-    except:
-        print("Error: too soon to read nodes property")
-        #tk.messagebox.showerror(title="D-BUS error", message="too soon to read nodes property")
-        return None, None
+        return None
+    if nodes is None:
+        return None
     #print(nodes)
-    gedges = []
-    gnodes = []
-    for n in nodes:
-        nname = ""
-        pname = ""
-        for i in range(0,8):
-            nname = nname + str(int(n[0][i]))
-        for i in range(0,8):
-            pname = pname + str(int(n[1]['parent'][i]))
-        gedges.append((nname,pname))
-        gnodes.append(nname)
-    globalinfo.set_connected_nodes(len(gnodes))
-    globalinfo.set_ref_timestamp(time.time())
-    globalinfo.set_nodes_timestamp(gnodes, time.time())
-    return gnodes, gedges
-
-def is_sim_running():
-    process1_name = 'wssimserver'
-    process2_name = 'wsbrd'
-    pid = None
-    try:
-        pid = subprocess.check_output(['pgrep', process1_name])
-        pid = pid.decode().strip()
-        # dummy check also if border router is running
-        _pid = subprocess.check_output(['pgrep', process2_name])
-    except subprocess.CalledProcessError:
+    # Nodes are decoded again only when the border router reported a new value
+    if brnodes[0] != brclient.version:
+        brnodes = (brclient.version, DecodeNodes(nodes))
+    return brnodes[1]
+
+def on_topology(snapshot):
+    """
+    Keep the connection state of GlobalInfo in sync with the sampled topology
+    """
+    if snapshot is None:
+        globalinfo.reset_connected_nodes()
+        return
+    globalinfo.set_connected_nodes(snapshot.reported)
+    globalinfo.set_ref_timestamp(snapshot.timestamp)
+    globalinfo.set_nodes_timestamp(snapshot.keys[snapshot.parent >= 0].tolist(), snapshot.timestamp)
+
+def record_topology(snapshot):
+    """
+    Append the sampled topology to the recording of the running simulation,
+    a new recording is started each time the topology becomes available
+    """
+    global recorder, record_failed_dir
+    record_dir = globalinfo.get_sim_settings().get('record_dir', "")
+    if recorder is None:
+        if snapshot is None or not record_dir or record_dir == record_failed_dir:
+            return
+        run_id = current_run_id()
+        filename = os.path.join(record_dir, f"run_{run_id + '_' if run_id else ''}"
+                                f"{time.strftime('%Y%m%d_%H%M%S')}.gmnrec")
+        try:
+            os.makedirs(record_dir, exist_ok=True)
+            # total_nodes: nodes that can join, the border router excluded
+            recorder = TopologyRecorder(filename, {'run_id': run_id, 'created': time.time(),
+                                                   'total_nodes': globalinfo.get_mesh_nodes(),
+                                                   'sample_interval': sampler.interval})
+        except OSError as e:
+            # reported once, recording stays off until another directory is set
+            record_failed_dir = record_dir
+            tk.messagebox.showwarning(title="Recording disabled", message=f"Cannot record the topology: {e}")
+            return
+    recorder.record(snapshot)
+    if snapshot is None:
+        # simulation stopped, the recorder thread finishes the file on its own
+        recorder.close(wait=False)
+        recorder = None
+
+def write_dag_file(snapshot):
+    """
+    Write the DAG edges of a topology snapshot into dag_<time>.dag
+    """
+    _dag = MeshPlotGetPosGetDag(snapshot.keys, snapshot.parent, False, True)
+    if _dag:
+        _edges = list(_dag.edges())
+        filename = "dag_" + str(time.strftime("%d_%H_%M_%S_n")) + ".dag"
+        with open(filename, "w") as f:
+            f.write(f"{_edges}\n")
+
+def current_run_id():
+    return globalinfo.get_sim_settings().get('varRunid', "")
+
+def sim_monitor(run_id=None):
+    """
+    Process monitor of the simulation instance run_id (current one by default)
+    """
+    if run_id is None:
+        run_id = current_run_id()
+    with monitors_lock:
+        if run_id not in monitors:
+            monitors[run_id] = ProcessMonitor(run_id)
+        return monitors[run_id]
+
+def is_sim_running(run_id=None):
+    # wssimserver PID, provided that the border router is running too
+    pid = sim_monitor(run_id).running()
+    if pid is None:
         print("No simulation running")
-    return pid
+        return None
+    return str(pid)
 ############################################################
 # Class: Global information
 class GlobalInfo:
+    # Node counters and timestamps can be written from the worker thread, readers get
+    # copies. Simulation settings hold Tk variables and stay on the Tk thread.
+    # Node counts include the border router, as the Nodes property of wsbrd does.
     def __init__(self):
         self.total_nodes = 0
         self.connected_nodes = 0
         self.sim_settings = dict()
         self.conn_timestamp = dict()
+        self.lock = threading.Lock()
 
     def set_total_nodes(self, num_nodes):
         self.total_nodes = num_nodes
@@ -102,6 +178,10 @@ class GlobalInfo:
     def get_total_nodes(self):
         return self.total_nodes
 
+    def get_mesh_nodes(self):
+        # nodes that can join the mesh: the border router excluded
+        return max(self.total_nodes - 1, 0)
+
     def get_connected_nodes(self):
         return self.connected_nodes
 
@@ -109,7 +189,9 @@ class GlobalInfo:
         self.sim_settings = {'varTundev': tk.IntVar(value=1), 'varNano': tk.IntVar(value=1),
                 'varRadio': tk.IntVar(value=1), 'varLog': "e.g: 1,5,6,50",
                 'varCleartmp': tk.IntVar(value=1), 'varTunip': "fd12:3456::1/64",
-                'sim_path': ""}
+                'varHeadless': tk.IntVar(value=0), 'varRunid': "", 'sim_path': "",
+                'sample_interval': 1.0, 'record_dir': "recordings", 'compare_clusters': False,
+                'metrics_file': "", 'metrics_port': 0, 'metrics_interval': 5.0}
 
     def set_sim_settings(self, sw_config):
         self.sim_settings['varTundev'].set(sw_config['varTundev'])
@@ -118,8 +200,21 @@ class GlobalInfo:
         self.sim_settings['varLog'] = sw_config['varLog']
         self.sim_settings['varCleartmp'].set(sw_config['varCleartmp'])
         self.sim_settings['varTunip'] = sw_config['varTunip']
+        if 'varHeadless' in sw_config.keys():
+            self.sim_settings['varHeadless'].set(sw_config['varHeadless'])
+        if 'varRunid' in sw_config.keys():
+            self.sim_settings['varRunid'] = sw_config['varRunid']
         if 'sim_path' in sw_config.keys():
             self.sim_settings['sim_path'] = sw_config['sim_path']
+        if 'sample_interval' in sw_config.keys():
+            self.sim_settings['sample_interval'] = sw_config['sample_interval']
+        if 'record_dir' in sw_config.keys():
+            self.sim_settings['record_dir'] = sw_config['record_dir']
+        if 'compare_clusters' in sw_config.keys():
+            self.sim_settings['compare_clusters'] = sw_config['compare_clusters']
+        for key in ('metrics_file', 'metrics_port', 'metrics_interval'):
+            if key in sw_config.keys():
+                self.sim_settings[key] = sw_config[key]
 
     def set_sim_setting_element(self, element, value):
         self.sim_settings[element] = value
@@ -128,23 +223,25 @@ class GlobalInfo:
         return self.sim_settings
 
     def set_ref_timestamp(self, timestamp):
-        if 'ref' not in self.conn_timestamp.keys():
-            self.conn_timestamp['ref'] = timestamp
+        with self.lock:
+            self.conn_timestamp.setdefault('ref', timestamp)
 
     def set_nodes_timestamp(self, nodes, timestamp):
-        for a_node in nodes:
-            if a_node not in self.conn_timestamp.keys():
-                self.conn_timestamp[a_node] = timestamp
+        with self.lock:
+            for a_node in nodes:
+                self.conn_timestamp.setdefault(a_node, timestamp)
 
     def get_all_timestamp(self):
-        return self.conn_timestamp
+        with self.lock:
+            return dict(self.conn_timestamp)
 
     def del_node_timestamp(self, node):
-        if node in self.conn_timestamp.keys():
-            del self.conn_timestamp[node]
+        with self.lock:
+            self.conn_timestamp.pop(node, None)
 
     def del_all_timestamp(self):
-        self.conn_timestamp.clear()
+        with self.lock:
+            self.conn_timestamp.clear()
 ############################################################
 # Class: Theme
 class Bt(tk.Button):
@@ -477,17 +574,6 @@ class GBuilder:
         globalinfo.set_total_nodes(num_raw_nodes)
 
 
-    def get_graph_diameter_from_edges(self):
-        if len(self.edges) == 0:
-            return 1
-        edges = []
-        if len(self.edges[0]) > 2:
-            edges = [(x, y) for x, y, m, l in self.edges]
-        else:
-            edges =[(x, y) for x, y in self.edges]
-        return GrphDiameter(edges)
-
-
     def change_labels_to_hex(self):
         if not self.id_textMode:
             self.id_textMode = 1
@@ -556,7 +642,7 @@ class GBuilder:
 ############################################################
 # Class: Config Window
 class ConfigDialog(tk.Toplevel):
-    def __init__(self, parent, VarTundev, VarNano, VarRadio, VarLog, VarCleartmp, VarTunip):
+    def __init__(self, parent, VarTundev, VarNano, VarRadio, VarLog, VarCleartmp, VarTunip, VarHeadless, VarRunid):
         super().__init__(parent)
 
         self.title("Simulation configuration")
@@ -568,6 +654,8 @@ class ConfigDialog(tk.Toplevel):
         self.varLog = VarLog
         self.varCleartmp = VarCleartmp
         self.varTunip = VarTunip
+        self.varHeadless = VarHeadless
+        self.varRunid = VarRunid
 
         sim_frame = tk.Frame(self, bg = _BG)
         sim_frame.pack(side=tk.TOP, padx=5, anchor=tk.NW)
@@ -597,6 +685,16 @@ class ConfigDialog(tk.Toplevel):
         self.Tunip.insert(0, self.varTunip)
         self.Tunip.pack(padx=5, pady=10, side=tk.LEFT)
 
+        sim_frame3 = tk.Frame(self, bg = _BG)
+        sim_frame3.pack(side=tk.TOP, padx=5, anchor=tk.NW)
+        Headless = Cb(sim_frame3, text="Headless (no terminals, logs in sim_logs/)", variable=self.varHeadless, bg=_BG, fg=_FG)
+        Headless.pack(padx=1, pady=10, side=tk.LEFT)
+        Runidlbl = Lb(sim_frame3, text="Run ID:")
+        Runidlbl.pack(padx=5, pady=10, side=tk.LEFT)
+        self.Runid = En(sim_frame3, width=12)
+        self.Runid.insert(0, self.varRunid)
+        self.Runid.pack(padx=5, pady=10, side=tk.LEFT)
+
         sim_frame2 = tk.Frame(self, bg = _BG)
         sim_frame2.pack(side=tk.TOP, padx=5, anchor=tk.NW)
         war_label = tk.Label(sim_frame2, text="Tip: Close this window to interact again with main window!", bg=_BG, fg="Red")
@@ -622,6 +720,9 @@ class ConfigDialog(tk.Toplevel):
         self.varNano.set(1)
         self.varRadio.set(1)
         self.varCleartmp.set(1)
+        self.varHeadless.set(0)
+        self.varRunid = ""
+        self.Runid.delete(0, tk.END)
         self.varLog = "e.g: 1,5,6,50"
         self.log.delete(0, tk.END)
         self.log.insert(0, self.varLog)
@@ -630,7 +731,7 @@ class ConfigDialog(tk.Toplevel):
         self.Tunip.insert(0, self.varTunip)
 
     def ok(self):
-        self.result = [str(self.Tunip.get()), str(self.log.get())]
+        self.result = [str(self.Tunip.get()), str(self.log.get()), str(self.Runid.get()).strip()]
         self.destroy()
 
     def cancel(self):
@@ -640,73 +741,159 @@ class ConfigDialog(tk.Toplevel):
 ############################################################
 # Class: Plot window
 class PlotDialog(tk.Toplevel):
-    def __init__(self, parent):
+    def __init__(self, parent, replay=None):
+        """
+        :param replay: topology.TopologyReplay to play a recording, the live topology otherwise
+        """
         super().__init__(parent)
 
-        self.title("Live Mesh")
+        self.replay = replay
+        self.source = replay if replay is not None else sampler
+        self.title("Live Mesh" if replay is None else "Replay - " + os.path.basename(replay.recording.filename))
         self.configure(bg='gray35')
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
-        # Before making canvas, get some hints about size of the window
-        # and fill gedges and gnodes
-        self.gedges = []
-        self.gnodes = []
-        pos, CVS_W, CVS_H = self.get_pos_w_h()
-        if pos is None:
-            """ tk.messagebox.showwarning("Error", "No nodes found!")
-            self.destroy()
-            return """
-            CVS_W = 200
-            CVS_H = 200
-        # now create the canvas
-        self.canvas = tk.Canvas(self, width=CVS_W, height=CVS_H, bg="gray45")
+        # The layout is computed on the worker, the canvas is resized once it is drawn
+        self.table = None
+        self.seq = -1
+        self.layout_pending = False
+        self.update_id = None # scheduled update_graph, cancelled when the window goes away
+        # canvas items of every drawn node by EUI-64 key: [x, y, oval, text, edge coords, edge lines]
+        self.items = dict()
+        self.canvas_size = (200, 200)
+        # layouts of the recent topologies, only used on the worker
+        self.layouts = LayoutCache()
+        self.canvas = tk.Canvas(self, width=200, height=200, bg="gray45")
         self.canvas.pack(side=tk.TOP, fill=tk.BOTH, expand=1)
 
         export_button = Bt(self, text="Export DAG", command=self.export_dag)
         export_button.pack(side=tk.RIGHT, pady=2)
+        if replay is not None:
+            self.make_replay_controls()
+            replay.start(self.after)
 
-        # draw the graph
-        self.draw_graph(pos)
-
-        # update the graph every 1 sec
+        # update the graph when the source has a new topology, first time in any case
         self.update_graph()
 
+    def make_replay_controls(self):
+        recording = self.replay.recording
+        self.play_button = Bt(self, text="Play", width=5, command=self.toggle_play)
+        self.play_button.pack(side=tk.LEFT, padx=2, pady=2)
+        self.speed = ttk.Combobox(self, values=["0.5x", "1x", "2x", "10x", "60x", "600x"], width=5, state="readonly")
+        self.speed.set("1x")
+        self.speed.bind("<<ComboboxSelected>>", lambda _e: setattr(self.replay, 'speed', float(self.speed.get()[:-1])))
+        self.speed.pack(side=tk.LEFT, padx=2, pady=2)
+        self.time_label = Lb(self, width=16)
+        self.time_label.pack(side=tk.LEFT, padx=2, pady=2)
+        self.duration = recording.end - recording.start
+        self.scrub = tk.Scale(self, from_=0, to=self.duration, resolution=0.1,
+                              orient=tk.HORIZONTAL, showvalue=0, bg='gray35', highlightthickness=0,
+                              command=self.on_scrub)
+        self.scrub.pack(side=tk.LEFT, fill=tk.X, expand=1, padx=2, pady=2)
+        self.update_replay_controls()
+
+    def toggle_play(self):
+        if self.replay.playing:
+            self.replay.pause()
+        else:
+            self.replay.play()
+        self.update_replay_controls()
+
+    def on_scrub(self, value):
+        # also called back when update_replay_controls moves the slider
+        position = self.replay.recording.start + float(value)
+        if abs(position - self.replay.position) > 0.1:
+            self.replay.seek(position)
+            self.update_replay_controls()
+
+    def update_replay_controls(self):
+        offset = self.replay.position - self.replay.recording.start
+        self.play_button.config(text="Pause" if self.replay.playing else "Play")
+        self.time_label.config(text=f"{offset:.1f} / {self.duration:.1f} s")
+        self.scrub.set(offset)
+
     def export_dag(self):
-        gnodes, gedges = get_sim_nodes()
-        if len(gedges):
-            _dag = MeshPlotGetPosGetDag(gedges, False, True)
-            if _dag:
-                _edges = list(_dag.edges())
-                filename = "dag_" + str(time.strftime("%d_%H_%M_%S_n")) + ".dag"
-                with open(filename, "w") as f:
-                    f.write(f"{_edges}\n")
+        table = self.source.latest
+        if table is not None and table.reported:
+            bridge.submit(write_dag_file, table)
         else:
             print("No edges available yet ... try again later")
 
     def update_graph(self):
-        self.canvas.delete("all")
-        pos, CVS_W, CVS_H = self.get_pos_w_h()
+        self.update_id = None
+        if not self.winfo_exists():
+            return
+        if self.replay is not None:
+            self.update_replay_controls()
+        latest = self.source.latest
+        if (latest.seq if latest else None) != self.seq and not self.layout_pending:
+            # lay out the new topology on the worker, drawn by on_layout
+            self.layout_pending = True
+            bridge.submit(self.get_pos_w_h, latest, callback=self.on_layout, errback=self.on_layout_error)
+        self.update_id = self.after(int(self.source.interval * 1000), self.update_graph)
+
+    def on_layout(self, layout):
+        self.layout_pending = False
+        snapshot, pos, CVS_W, CVS_H = layout
+        if not self.winfo_exists():
+            return
+        self.table = snapshot
+        self.seq = snapshot.seq if snapshot else None
         if pos is not None:
+            self.canvas.delete("placeholder")
             # resize the canvas
-            #print("Updating graph every 1 sec")
-            self.canvas.config(width=CVS_W, height=CVS_H)
+            if (CVS_W, CVS_H) != self.canvas_size:
+                self.canvas_size = (CVS_W, CVS_H)
+                self.canvas.config(width=CVS_W, height=CVS_H)
             self.draw_graph(pos)
-        else:
-            self.canvas.create_text(100, 100, text="No nodes yet, wait please ...")
-        self.after(1000, self.update_graph)
+        elif self.items or not self.canvas.find_withtag("placeholder"):
+            self.canvas.delete("all")
+            self.items.clear()
+            self.canvas.create_text(100, 100, text="No nodes yet, wait please ...", tags="placeholder")
+
+    def on_layout_error(self, error):
+        self.layout_pending = False
+        print("Layout failed:", repr(error))
 
     def draw_graph(self, pos):
-        # draw nodes:
-        # hint: pos is a dict: {nodeid: (x, y)}
+        # Diff the new layout against the drawn items: only the nodes that joined, left or
+        # moved, and the edges whose ends moved, are touched.
+        # hint: pos is an (n, 2) array indexed like the node table, NaN for nodes not in the tree
         if pos is None:
             return
-        for nodeid, (x, y) in pos.items():
-            lbl = int(str(nodeid)[6:7]) * 256 + int(str(nodeid)[7:])
-            node, text = self.draw_node(x, y, str(lbl))
-        # draw edges:
-        for e in self.gedges:
-            x1, y1 = pos[e[0]]
-            x2, y2 = pos[e[1]]
-            line1, line2 = self.draw_line(x1, y1, x2, y2)
+        placed = ~np.isnan(pos[:, 0])
+        keys = self.table.keys.tolist()
+        labels = NodeLabels(self.table.keys).tolist()
+        parent = self.table.parent.tolist()
+        xy = pos.tolist()
+        nodes = dict()
+        for i in np.flatnonzero(placed).tolist():
+            p = parent[i]
+            edge = (xy[i][0], xy[i][1], xy[p][0], xy[p][1]) if p >= 0 and placed[p] else None
+            nodes[keys[i]] = (xy[i][0], xy[i][1], labels[i], edge)
+        # nodes gone from the tree
+        for key in [key for key in self.items if key not in nodes]:
+            _x, _y, node, text, _edge, lines = self.items.pop(key)
+            self.canvas.delete(node, text, *lines)
+        for key, (x, y, label, edge) in nodes.items():
+            item = self.items.get(key)
+            if item is None:
+                node, text = self.draw_node(x, y, str(label))
+                item = self.items[key] = [x, y, node, text, None, ()]
+            elif item[0] != x or item[1] != y:
+                self.canvas.coords(item[2], x-10, y-10, x+10, y+10)
+                self.canvas.coords(item[3], x, y)
+                item[0], item[1] = x, y
+            # edge to the parent
+            if edge != item[4]:
+                if edge is None:
+                    self.canvas.delete(*item[5])
+                    item[5] = ()
+                elif item[5]:
+                    for line in item[5]:
+                        self.canvas.coords(line, *edge)
+                else:
+                    item[5] = self.draw_line(*edge)
+                item[4] = edge
 
     def draw_line(self, x1, y1, x2, y2):
         line1 = self.canvas.create_line(x1, y1, x2, y2, arrow=None, fill="#222", width=2)
@@ -731,65 +918,100 @@ class PlotDialog(tk.Toplevel):
         # required to update canvas and attached toolbar!
         self.canvas.draw()
 
-    def get_sim_topology(self):
-        gnodes, gedges = get_sim_nodes()
-        if not gnodes or not gedges:
+    def get_sim_topology(self, table):
+        if table is None or table.reported == 0:
+            return
+        # the border router is in the table as the root
+        root = RootIndex(table)
+        if root < 0:
             return
-        bordernode = ""
-        for p in gedges:
-            if not p[1] in gnodes:
-                bordernode = p[1]
-        gnodes.append(bordernode)
-        self.gedges = gedges
-        self.gnodes = gnodes
-        return MeshPlotGetPosGetDag(gedges, True, False)
-
-    def get_pos_w_h(self):
-        pos = self.get_sim_topology()
+        # cached when the topology was seen recently, only changed subtrees are laid out again
+        return DotPositions(self.layouts.layout(table.keys, table.parent, root))
+
+    def get_pos_w_h(self, snapshot):
+        """
+        Canvas positions of the snapshot nodes, runs on the worker thread
+        :return: snapshot, positions array, canvas width and height
+        """
+        pos = self.get_sim_topology(snapshot)
         # scale posses to fit in max size we can draw:
         max_hz = 1400 # define max W
         max_vt = 900 # define max H
-        if pos == None:
-            return None, None, None
+        if pos is None:
+            return snapshot, None, None, None
         # check the max x and y in pos:
-        max_pos_x = max(pos.values(), key=lambda x: x[0])[0]
-        max_pos_y = max(pos.values(), key=lambda x: x[1])[1]
+        max_pos_x, max_pos_y = np.nanmax(pos, axis=0)
         scale_x = 1
         scale_y = 1
         if max_pos_x > max_hz or max_pos_y > max_vt:
             scale_x = (max_hz/max_pos_x)/1
             scale_y = (max_vt/max_pos_y)/1.5
-        new_pos = {}
-        for k in pos:
-            new_pos[k] = (pos[k][0]*scale_x, pos[k][1]*scale_y)
-        pos = new_pos
+        pos = pos * (scale_x, scale_y)
         # Determine W and H of canvas to be drawn:
-        CVS_W = max(pos.values(), key=lambda x: x[0])[0] + 15 # 15 is margin right and bottom
-        CVS_H = max(pos.values(), key=lambda x: x[1])[1] + 15
+        CVS_W, CVS_H = np.nanmax(pos, axis=0) + 15 # 15 is margin right and bottom
         # subtract CVS_H from y of poses to flip the graph:
-        new_pos = {}
-        for k in pos:
-            new_pos[k] = (pos[k][0], CVS_H-pos[k][1])
-        pos = new_pos
-        return pos, CVS_W, CVS_H
+        pos[:, 1] = CVS_H - pos[:, 1]
+        return snapshot, pos, float(CVS_W), float(CVS_H)
 
     def on_closing(self):
         # destroy the window when the "WM_DELETE_WINDOW" event is triggered
         self.destroy()
 
+    def destroy(self):
+        # also called directly when the simulation stops or a new window replaces this one
+        if self.update_id is not None:
+            self.after_cancel(self.update_id)
+            self.update_id = None
+        if self.replay is not None:
+            self.replay.stop()
+            self.replay.recording.close()
+            self.replay = None
+        super().destroy()
+
 ############################################################
 # Global variables
 globalinfo = GlobalInfo()
 plotd = None
+simsups = dict() # headless simulations started from the GUI, by run ID
+brclient = None # D-Bus client of the border router, connected on first use
+monitors = dict() # simulator processes by run ID
+monitors_lock = threading.Lock()
+bridge = None # runs the blocking work off the Tk thread, created with the main window
+brnodes = (None, None) # Nodes version and its decoded table
+sampler = TopologySampler(get_sim_nodes) # only reader of the border router, views use its snapshots
+sampler.subscribe(on_topology)
+sampler.subscribe(record_topology)
+recorder = None # recording of the running simulation
+record_failed_dir = None # recording directory that could not be written
+exporter = None # metrics exposition, when enabled in config.json
 
 ############################################################
 # Main
+def start_metrics():
+    """
+    Export the mesh metrics to a file and/or a localhost HTTP port, if set in config.json
+    """
+    global exporter
+    sim_settings = globalinfo.get_sim_settings()
+    if not sim_settings['metrics_file'] and not sim_settings['metrics_port']:
+        return
+    metrics = MeshMetrics(globalinfo.get_mesh_nodes, current_run_id)
+    sampler.subscribe(metrics.update)
+    exporter = MetricsExporter(metrics, sim_settings['metrics_file'], int(sim_settings['metrics_port']),
+                               float(sim_settings['metrics_interval']))
+    try:
+        exporter.start()
+    except OSError as e:
+        print("Cannot export the metrics:", e)
+
 def main():
+    global bridge
 
     _root = tk.Tk()
     _root.title("GMNsim") # Graph and Mesh Network Simulation Tool
     # '_root.geometry("800x500")
     _root.resizable(1,1)
+    bridge = TkBridge(_root)
 
     ttkstyle = ttk.Style()
     ttkstyle.theme_use('alt')
@@ -808,9 +1030,8 @@ def main():
                 if os.path.exists(filename):
                     read_sim_dump(filename)
                 else:
-                    pids = subprocess.check_output(["pgrep", "wshwsim"])
-                    pids = pids.decode('utf-8').split('\n')
-                    globalinfo.set_total_nodes(len(pids) - 2)
+                    # one wshwsim per node, the border router included
+                    globalinfo.set_total_nodes(sim_monitor().count('wshwsim'))
             else:
                 globalinfo.reset_total_nodes()
 
@@ -839,9 +1060,22 @@ def main():
         serialized_sim_settings['varLog'] = sim_settings['varLog']
         serialized_sim_settings['varCleartmp'] = sim_settings['varCleartmp'].get()
         serialized_sim_settings['varTunip'] = sim_settings['varTunip']
+        serialized_sim_settings['varHeadless'] = sim_settings['varHeadless'].get()
+        serialized_sim_settings['varRunid'] = sim_settings['varRunid']
         serialized_sim_settings['sim_path'] = sim_settings['sim_path']
+        serialized_sim_settings['sample_interval'] = sim_settings['sample_interval']
+        serialized_sim_settings['record_dir'] = sim_settings['record_dir']
+        serialized_sim_settings['compare_clusters'] = sim_settings['compare_clusters']
+        serialized_sim_settings['metrics_file'] = sim_settings['metrics_file']
+        serialized_sim_settings['metrics_port'] = sim_settings['metrics_port']
+        serialized_sim_settings['metrics_interval'] = sim_settings['metrics_interval']
         with open("config.json", "w") as f:
             json.dump(serialized_sim_settings, f)
+        bridge.shutdown()
+        if recorder is not None:
+            recorder.close()
+        if exporter is not None:
+            exporter.stop()
         _root.quit()
     _root.protocol("WM_DELETE_WINDOW", on_window_close)
 
@@ -851,7 +1085,8 @@ def main():
         print(sim_settings)
         simconf = ConfigDialog(_root, sim_settings['varTundev'], sim_settings['varNano'],
                                  sim_settings['varRadio'], sim_settings['varLog'],
-                                 sim_settings['varCleartmp'], sim_settings['varTunip'])
+                                 sim_settings['varCleartmp'], sim_settings['varTunip'],
+                                 sim_settings['varHeadless'], sim_settings['varRunid'])
         simconf.grab_set()  # disable interaction with other windows
         _root.wait_window(simconf)  # wait for the dialog to be closed
 
@@ -859,6 +1094,11 @@ def main():
             print(f"Selected settings: {simconf.result}")
             globalinfo.set_sim_setting_element('varTunip', simconf.result[0])
             globalinfo.set_sim_setting_element('varLog', simconf.result[1])
+            try:
+                RunPaths(simconf.result[2])
+                globalinfo.set_sim_setting_element('varRunid', simconf.result[2])
+            except ValueError as e:
+                tk.messagebox.showwarning(title="Invalid run ID", message=str(e))
         #print(sim_settings)
 
     def select_dir():
@@ -867,11 +1107,11 @@ def main():
             sim_path.set(dir)
             globalinfo.set_sim_setting_element('sim_path', dir)
 
-    def export_runscript(for_sim=False):
-        print("Exporting configuration")
+    def get_sim_args():
+        """
+        Arguments of a simulation of the canvas graph, shared by the runscript and the supervisor
+        """
         sim_settings = globalinfo.get_sim_settings()
-        if builder.node_list_index < 1:
-            return
         edg = []
         for e in builder.edges:
             anedge =(e[0],e[1])
@@ -889,12 +1129,18 @@ def main():
             be_logged = be_logged.split(",")
         log_nano = sim_settings['varNano'].get()
         log_radio = sim_settings['varRadio'].get()
+        return builder.node_list_index, edg, sim_path.get(), cleanup_tmp, add_tun, tunip, log_nano, log_radio, be_logged
 
+    def export_runscript(for_sim=False):
+        print("Exporting configuration")
+        if builder.node_list_index < 1:
+            return
         print("Selected directory: ", sim_path.get())
-        complete_conf = SimConfGen(builder.node_list_index, edg, sim_path.get(), cleanup_tmp, add_tun, tunip, log_nano, log_radio, be_logged, None)
+        run_id = current_run_id()
+        complete_conf = SimConfGen(*get_sim_args(), {'run_id': run_id})
         new_name = ''
         if for_sim:
-            new_name = "run.sh"
+            new_name = f"run_{run_id}.sh" if run_id else "run.sh"
             print("Running simulation")
         else:
             new_name = "run_" + str(time.strftime("%d_%H_%M_%S_n")) + str(builder.node_list_index) + ".sh"
@@ -938,29 +1184,60 @@ def main():
             print("Please select a directory")
             tk.messagebox.showinfo(title="First Things First!", message="Please select simulation executables directory")
             return
+        if sim_settings['varHeadless'].get():
+            start_headless_sim()
+            return
         export_runscript(True)
         # Run "run.sh" script
-        subprocess.Popen(['gnome-terminal', '--', 'bash', '-c', 'bash run.sh; exec bash'])
+        run_id = current_run_id()
+        script = f"run_{run_id}.sh" if run_id else "run.sh"
+        subprocess.Popen(['gnome-terminal', '--', 'bash', '-c', f'bash {script}; exec bash'])
+        sim_monitor(run_id).invalidate()
+
+    def start_headless_sim():
+        run_id = current_run_id()
+        print("Running simulation without terminals, logs in sim_logs/")
+        simsup = SimSupervisor(*get_sim_args(), run_id=run_id)
+        simsups[run_id] = simsup
+        started = simsup.start_background()
+        sim_monitor(run_id).invalidate()
+        def on_start_failed(error):
+            # start already tore down the processes it spawned
+            if simsups.get(run_id) is simsup:
+                del simsups[run_id]
+                bridge.submit(simsup.stop, long=True)
+            sim_monitor(run_id).invalidate()
+            tk.messagebox.showerror(title="Simulation failed to start", message=str(error))
+        bridge.watch(started, errback=on_start_failed)
+
+    def on_sim_stopped():
+        # check if any instance of PlotDialog class is created:
+        if plotd is not None:
+            plotd.destroy()
+        globalinfo.reset_connected_nodes()
+        # If total nodes value retrived from the running sim and there is not
+        # any nodes in canvas:
+        if builder.node_list_index < 1:
+            globalinfo.reset_total_nodes()
+        update_status_progress_bar()
+        globalinfo.del_all_timestamp()
 
     def stop_sim():
-        process_name = 'wssimserver'
-        try:
-            pid = subprocess.check_output(['pgrep', process_name])
-            pid = pid.decode().strip()
-            # Killing wssimserver will kill all the nodes
-            # wssimserver runs in userspace, no need to sudo here
-            subprocess.run(['kill', '-9', str(pid)])
-            # check if any instance of PlotDialog class is created:
-            if plotd is not None:
-                plotd.destroy()
-            globalinfo.reset_connected_nodes()
-            # If total nodes value retrived from the running sim and there is not
-            # any nodes in canvas:
-            if builder.node_list_index < 1:
-                globalinfo.reset_total_nodes()
-            update_status_progress_bar()
-            globalinfo.del_all_timestamp()
-        except subprocess.CalledProcessError:
+        # Only the instance of the current run ID is stopped
+        run_id = current_run_id()
+        if run_id in simsups:
+            # Started headless: the whole process group is torn down by the supervisor,
+            # which may take a few seconds, off the worker that samples the topology
+            def teardown(simsup):
+                simsup.stop()
+                sim_monitor(run_id).invalidate()
+            bridge.submit(teardown, simsups.pop(run_id), callback=lambda _: on_sim_stopped(), long=True)
+            return
+        # Killing wssimserver will kill all the nodes
+        # wssimserver runs in userspace, no need to sudo here
+        if sim_monitor(run_id).kill('wssimserver'):
+            on_sim_stopped()
+        else:
             print("No simulation running")
             tk.messagebox.showwarning(title="No simulation running", message="No simulation running")
 
@@ -972,6 +1249,10 @@ def main():
         if genmode.get() == "Semi-Managed":
             Alpha = alpha.get()
             Beta = beta.get()
+            feasibility = CheckSemiManagedParams(Nnodes, Mdegree, float(Alpha), float(Beta))
+            if not feasibility.feasible:
+                tk.messagebox.showwarning(title="Infeasible parameters", message=DescribeFeasibility(feasibility))
+                return
             edges = RndMeshGen(Nnodes, Mdegree, float(Alpha), float(Beta))
         else: # Managed
             lys = int(nlyrnum.get())
@@ -979,11 +1260,11 @@ def main():
             max_npl = int(nmaxnum.get())
             n_l1 = int(n1stnum.get())
             acc = int(accurate.get())
-            if acc:
-                if (lys * max_npl)/Nnodes < 1.15 or (Nnodes > 200 and (max_npl/min_npl) > 2):
-                    yesno = tk.messagebox.askyesno(title="Warning", message="Finding a solution may be impossible. Continue?")
-                    if not yesno:
-                        return
+            # Decide before generating, the generator would only fail after trying
+            feasibility = CheckManagedParams(Nnodes, lys, min_npl, max_npl, n_l1, acc)
+            if not feasibility.feasible:
+                tk.messagebox.showwarning(title="Infeasible parameters", message=DescribeFeasibility(feasibility))
+                return
             _ , edges = MngRndMeshGen(Nnodes, lys, min_npl, max_npl, n_l1, Mdegree, acc)
             if len(edges) == 0:
                 tk.messagebox.showwarning(title="Warning", message="No solution found, adjust parameters and try again")
@@ -1003,10 +1284,11 @@ def main():
             tss.pop('ref')
             yy = list(tss.values())
             yy = [y - ref for y in yy]
-            xx = list(tss.keys())
-            xx = [int(str(x)[6:7]) * 256 + int(str(x)[7:]) for x in xx]
+            xx = NodeLabels(list(tss.keys())).tolist()
             #print('lbl: ', xx)
-            fig, (ax, bx) = plt.subplots(1, 2, figsize=(15, 8))
+            compare = globalinfo.get_sim_settings()['compare_clusters']
+            fig, axes = plt.subplots(1, 3 if compare else 2, figsize=(22 if compare else 15, 8))
+            ax, bx = axes[0], axes[1]
             colours = plt.get_cmap('Blues')(np.linspace(0.2, 0.9, len(xx)))
             ax.bar(xx, yy, color=colours)
             ax.set_ylabel('Connection time (s)')
@@ -1018,35 +1300,95 @@ def main():
             ax.xaxis.grid(False)
             ax.set_title('Connection time for each node')
 
-            ncls = builder.get_graph_diameter_from_edges()
-            print(ncls)
-            X = np.array(yy).reshape(-1, 1)
-            # Cluster the data using the optimal number of clusters
-            kmeans = KMeans(n_clusters=ncls, init='k-means++', random_state=42, n_init='auto')
-            kmeans.fit_predict(X)
-            labels = kmeans.predict(X)
-            labels = [l+1 for l in labels]
-            bx.scatter(labels, X, c=labels)
-            bx.set_xticks(range(0, ncls))
-            #bx.set_xticklabels([f"cat_{x}" for x in range(0,ncls)])
+            # The layer of a node is its hop depth in the RPL tree of the border router,
+            # -1 for the nodes not in the current topology
+            yy = np.array(yy)
+            depths = np.full(len(yy), -1)
+            table = sampler.latest
+            if table is not None and len(table.keys):
+                table_depths = HopDepths(table.parent, RootIndex(table))
+                keys = np.array(list(tss.keys()), dtype=np.uint64)
+                idx = np.searchsorted(table.keys, keys).clip(0, len(table.keys) - 1)
+                found = table.keys[idx] == keys
+                depths[found] = table_depths[idx[found]]
+            stats = DepthStats(depths, yy)
+            for layer in stats:
+                print(f"depth {layer.depth}: {layer.count} nodes, min {layer.min:.1f} s, "
+                      f"median {layer.median:.1f} s, p95 {layer.p95:.1f} s")
+            in_tree = depths >= 0
+            bx.scatter(depths[in_tree], yy[in_tree], c=depths[in_tree], cmap='viridis', alpha=0.6)
+            if stats:
+                layer_depths = [layer.depth for layer in stats]
+                bx.plot(layer_depths, [layer.min for layer in stats], 'v--', color='grey', label='min')
+                bx.plot(layer_depths, [layer.median for layer in stats], 'o-', color='black', label='median')
+                bx.plot(layer_depths, [layer.p95 for layer in stats], '^--', color='red', label='p95')
+                bx.set_xticks(layer_depths)
+                bx.legend()
             bx.grid(True, color='#EEEEEE')
-            bx.set_title('Groupe of nodes in each layer')
+            bx.set_title('Connection time by hop depth')
             bx.set_ylabel('Connection time (s)')
-            bx.set_ylabel('Catagory')
+            bx.set_xlabel('Hop depth')
+
+            if compare:
+                # Exact 1-D clustering of the join times, as many clusters as depths
+                labels, _means = OptimalClusters(yy, max(len(stats), 1))
+                labels = labels + 1
+                cx = axes[2]
+                cx.scatter(labels, yy, c=labels)
+                cx.set_xticks(range(1, labels.max() + 1))
+                cx.grid(True, color='#EEEEEE')
+                cx.set_title('Clusters of connection times (1-D optimal)')
+                cx.set_ylabel('Connection time (s)')
+                cx.set_xlabel('Cluster')
 
             fig.tight_layout()
             plt.show()
 
     def draw_sim_topology():
-        gnodes, gedges = get_sim_nodes()
+        table = sampler.latest
         # plot the graph:
         if selected_plot_opt.get() == "Static plot":
-            if gnodes is None or gedges is None:
+            if table is None or table.reported == 0:
                 return
-            MeshPlotGetPosGetDag(gedges, False, False)
+            MeshPlotGetPosGetDag(table.keys, table.parent, False, False)
         else:
             open_plot_dialog()
 
+    def open_replay():
+        name = filedialog.askopenfilename(filetypes=[('Topology recordings', '*.gmnrec')],
+                                          initialdir=globalinfo.get_sim_settings()['record_dir'] or None)
+        if type(name) != str or name == "":
+            return
+        # the index of a long recording is built on the worker
+        bridge.submit(OpenRecording, name, callback=open_replay_dialog,
+                      errback=lambda e: tk.messagebox.showerror("Error", f"Cannot open the recording: {e}"))
+
+    def open_replay_dialog(recording):
+        if len(recording) == 0:
+            recording.close()
+            tk.messagebox.showwarning("Empty recording", "No topology in this recording")
+            return
+        PlotDialog(_root, TopologyReplay(recording))
+
+    def create_report():
+        names = filedialog.askopenfilenames(filetypes=[('Topology recordings', '*.gmnrec')],
+                                            initialdir=globalinfo.get_sim_settings()['record_dir'] or None)
+        if not names:
+            return
+        out_dir = os.path.join("reports", "report_" + time.strftime("%Y%m%d_%H%M%S"))
+        mk_report.config(state=tk.DISABLED, text="Creating report ...")
+        # figures are rendered by worker processes, the window stays responsive
+        bridge.submit(MakeReport, list(names), out_dir, callback=on_report_done, errback=on_report_failed, long=True)
+
+    def on_report_done(filename):
+        mk_report.config(state=tk.NORMAL, text="Create report")
+        if tk.messagebox.askyesno("Report created", f"Report written to {filename}\nOpen it now?"):
+            webbrowser.open("file://" + os.path.abspath(filename))
+
+    def on_report_failed(error):
+        mk_report.config(state=tk.NORMAL, text="Create report")
+        tk.messagebox.showerror("Error", f"Cannot create the report: {error}")
+
     def open_plot_dialog():
         global plotd
         if plotd is not None:
@@ -1060,16 +1402,9 @@ def main():
         progress_bar.config(value=globalinfo.get_connected_nodes(), maximum=globalinfo.get_total_nodes())
 
     def start_progress_bar():
-        if is_sim_running():
-            try:
-                # This is a hack to check if the plot dialog is exists
-                # Since upon closing the plot dialog, plotd is not set to None
-                if plotd.state() == "withdrawn":
-                    pass
-            except:
-                get_sim_nodes()
-            if globalinfo.get_total_nodes() > 0:
-                update_status_progress_bar()
+        # connected nodes are updated by the topology sampler
+        if globalinfo.get_total_nodes() > 0:
+            update_status_progress_bar()
         _root.after(1000, start_progress_bar)
 
     def update_gen_mode():
@@ -1147,9 +1482,11 @@ def main():
     rb2.pack(pady=0)
     plt_rpl = Bt(sim_frame, command=draw_sim_topology, text="RPL plot")
     plt_rpl.pack(padx=10, pady=10, side=tk.LEFT)
+    replay_btn = Bt(sim_frame, command=open_replay, text="Replay")
+    replay_btn.pack(padx=10, pady=10, side=tk.LEFT)
     conn_time = Bt(sim_frame, command=drae_connection_time, text="Connection time")
     conn_time.pack(padx=10, pady=10, side=tk.LEFT)
-    mk_report = Bt(sim_frame, command=None, text="Create report")
+    mk_report = Bt(sim_frame, command=create_report, text="Create report")
     mk_report.pack(padx=10, pady=10, side=tk.LEFT)
     start_sim_btn = Bt(sim_frame, color='green', command=start_sim, text="Start simulation")
     start_sim_btn.pack(padx=10, pady=10, side=tk.RIGHT)
@@ -1260,8 +1597,11 @@ def main():
     # If user wants to retrieve the sim info
     retrive_sim_info()
     update_status_progress_bar()
-    # Start progress bar
+    # Start sampling the topology and the progress bar
+    sampler.interval = globalinfo.get_sim_settings()['sample_interval']
+    sampler.start(_root.after, bridge.submit)
     start_progress_bar()
+    start_metrics()
 
     update_gen_mode()
 
@@ -3,55 +3,107 @@
 ## AUTHOR: Mahboob Karimian
 ## COPYRIGHT: 2023
 
+import math
 import random
 import numpy as np
-import networkx as nx
-import matplotlib.pyplot as plt
 
-def gen_random_num_nodes_per_layer(m, n, min_val, max_val, nfl, accurate):
+from daggen import get_pos_dag, sample_distinct_columns
+from lazyimport import LazyModule
+
+# Only needed for plotting
+nx = LazyModule('networkx')
+plt = LazyModule('matplotlib.pyplot')
+
+def _composition_row(prev, k, width, target):
+        """
+        Row k of the counting table of sample_bounded_composition from row k-1, scaled by its max.
+        Rows are symmetric around k*width/2 and grow towards the middle: the left half is
+        summed from small values without cancellation and mirrored onto the right half.
+        """
+        s = np.arange(target + 1)
+        prefix = np.concatenate(([0.0], np.cumsum(prev)))
+        row = prefix[s + 1] - prefix[np.maximum(s - width, 0)]
+        top = min(target, k * width)
+        row[top + 1:] = 0.0
+        right = s[(2 * s > k * width) & (s <= top)]
+        row[right] = row[k * width - right]
+        return row / row.max()
+
+def sample_bounded_composition(total, parts, min_val, max_val, rng):
+        """
+        Draw uniformly among all the ways to write "total" as an ordered sum of "parts" integers
+        between min_val and max_val. A counting DP over (parts, sum) gives the number of
+        completions of every prefix, so the draw never retries: O(parts * total) time.
+        Only every sqrt(parts)-th row of the table is kept, the rows in between are computed
+        again block by block during the draw: O(sqrt(parts) * total) memory.
+        "rng": numpy.random.Generator
+        Returns None if there is no solution.
+        """
+        if parts < 0 or min_val > max_val or parts * min_val > total or parts * max_val < total:
+            return None
+        width = max_val - min_val
+        target = total - parts * min_val  # each part shifted to [0, width]
+        # ways k: number of ways k shifted parts sum up to s, for s in 0..target.
+        # The draw reads the rows parts-1 down to 0.
+        step = max(1, math.isqrt(parts))
+        checkpoints = dict()
+        row = np.zeros(target + 1)
+        row[0] = 1.0
+        for k in range(parts):
+            if k % step == 0:
+                checkpoints[k] = row
+            row = _composition_row(row, k + 1, width, target)
+
+        numbers = []
+        rest = target
+        block = []
+        for k in range(parts, 0, -1):
+            if not block:
+                # rows first .. k-1, from the checkpoint before them
+                first = (k - 1) // step * step
+                block = [checkpoints.pop(first)]
+                for j in range(first + 1, k):
+                    block.append(_composition_row(block[-1], j, width, target))
+            values = np.arange(min(width, rest) + 1)
+            p = block.pop()[rest - values]
+            if p.sum() <= 0:
+                # only reachable through values too unlikely for float precision
+                p = (rest - values <= (k - 1) * width).astype(float)
+            v = int(rng.choice(values, p=p / p.sum()))
+            numbers.append(min_val + v)
+            rest -= v
+        return numbers
+
+def gen_random_num_nodes_per_layer(m, n, min_val, max_val, nfl, accurate, rng=None):
         """
         Generate n random integers between min_val and max_val whose sum equals to m.
         "nfl": the first number in the list
+        "accurate": the first number is exactly nfl and the others are drawn uniformly among
+        the exact solutions, [] is returned at once if there is none
+        "rng": numpy.random.Generator, by default seeded from the random module
         """
-        # Check if it's possible to generate n random numbers whose sum equals to m
-        if n * min_val > m or n * max_val < m:
+        if rng is None:
+            rng = np.random.default_rng(random.getrandbits(64))
+        if accurate:
+            if n < 1:
+                return []
+            others = sample_bounded_composition(m - nfl, n - 1, min_val, max_val, rng)
+            if others is None:
+                print("Cannot generate layers between min_val and max_val whose sum equals to m with nfl nodes in the first one.")
+                return []
+            return [nfl] + others
+
+        # n random numbers between min_val and max_val whose sum equals to m, found whenever
+        # feasibility.check_managed_params says so
+        numbers = sample_bounded_composition(m, n, min_val, max_val, rng)
+        if not numbers:
             print("Cannot generate n random numbers between min_val and max_val whose sum equals to m.")
             return []
 
-        numbers = []
-        cnt = 0
-        max_try = 500000
-        if not accurate:
-            while True:
-                cnt += 1
-                # Generate n-1 random numbers between min_val and max_val
-                numbers = [random.randint(min_val, max_val) for _ in range(n-1)]
-                # Calculate the last number to ensure that the sum equals to m
-                numbers.append(m - sum(numbers))
-                if numbers[-1] >= min_val:
-                    break
-                # Avoid infinite loop
-                if cnt > max_try:
-                    return []
-        else:
-            # Generate n-2 random numbers between min_val and max_val
-            print("went2while")
-            while True:
-                cnt += 1
-                numbers = [random.randint(min_val, max_val) for _ in range(n-2)]
-                numbers.insert(0, nfl)
-                # Calculate the last number to ensure that the sum equals to m
-                numbers.append(m - sum(numbers))
-                print("numbers: ", numbers[-1], cnt)
-                if (numbers[-1] >= min_val and numbers[-1] <= max_val):
-                    break
-                # Avoid infinite loop
-                if cnt > max_try:
-                    return []
-
-        # Check the first number to ensure it is the specified value
+        # Check the first number to ensure it is the specified value,
+        # a single layer has no other layer to take the difference and keeps all the nodes
         diff = 0
-        if numbers[0] > nfl:
+        if numbers[0] > nfl and n > 1:
             diff = numbers[0] - nfl
             numbers[0] = nfl
         
@@ -61,7 +113,7 @@ def gen_random_num_nodes_per_layer(m, n, min_val, max_val, nfl, accurate):
             new_numbers.append(numbers[0])
             # Distribute the difference to the other numbers
             k = len(numbers) - 1
-            additin_list = np.random.multinomial(diff, np.ones(k)/k)
+            additin_list = rng.multinomial(diff, np.ones(k)/k)
             i = 1
             while i < len(numbers):
                 new_numbers.append(numbers[i] + additin_list[i-1])
@@ -73,49 +125,57 @@ def gen_random_num_nodes_per_layer(m, n, min_val, max_val, nfl, accurate):
             print("The maximum value of nodes per layer exceeded the max.", max(new_numbers), max_val)
         return new_numbers
 
+def random_dag_arrays(num_nodes, num_layers, min_num_nodes_per_layer, max_num_nodes_per_layer,
+                num_first_layer, max_outgoing_edges, accurate=False, rng=None):
+    """
+    Array version of random_dag for very large graphs. Node ids are assigned per layer with
+    range arithmetic, the out-degrees of all nodes are drawn in one call and every node picks
+    its parents in the previous layer in one vectorized pass.
+    "rng": numpy.random.Generator or seed, by default seeded from the random module
+    Returns the int32 src, dst edge arrays and the number of nodes per layer
+    (all empty if no layer sizes were found).
+    """
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+    rng = np.random.default_rng(rng)
+    sizes = np.array(gen_random_num_nodes_per_layer(num_nodes - 1, num_layers, min_num_nodes_per_layer,
+                                                    max_num_nodes_per_layer, num_first_layer, accurate, rng),
+                     dtype=np.int64)
+    if len(sizes) == 0:
+        empty = np.empty(0, dtype=np.int32)
+        return empty, empty, empty
+
+    # Layer i holds the ids first[i] .. first[i+1]-1
+    first = 1 + np.concatenate(([0], np.cumsum(sizes)))
+    layer = np.repeat(np.arange(len(sizes)), sizes)
+    # Connect the nodes of every layer but the first one to the previous layer
+    children = np.arange(first[1], first[-1])
+    prev_layer = layer[children - 1] - 1
+    num_outgoing_edges = rng.integers(1, max_outgoing_edges + 1, size=len(children))
+    rows, cols = sample_distinct_columns(rng, num_outgoing_edges, sizes[prev_layer])
+    src = cols + first[prev_layer[rows]]
+    dst = children[rows]
+
+    # the border router is the parent of the first num_first_layer nodes that exist, and at
+    # least of the whole first layer
+    num_br_children = min(max(num_first_layer, int(sizes[0])), int(sizes.sum()))
+    src = np.concatenate((src, np.zeros(num_br_children, dtype=np.int64)))
+    dst = np.concatenate((dst, np.arange(1, num_br_children + 1)))
+    return src.astype(np.int32), dst.astype(np.int32), sizes.astype(np.int32)
+
 def random_dag(num_nodes, num_layers, min_num_nodes_per_layer, max_num_nodes_per_layer,
-                num_first_layer, max_outgoing_edges, accurate=False):
+                num_first_layer, max_outgoing_edges, accurate=False, rng=None):
     """
     Generate a random DAG graph based on the provided arguments.
     "accurate": if True then the number of nodes per layer must not excced the max_num_nodes_per_layer
+    Returns the list of nodes and the list of (parent, child) edges, see random_dag_arrays.
     """
-    nodes = []
-    edges = []
-    node_count = 1
-    virtual_num_nodes = num_nodes - 1
-    random_integers = gen_random_num_nodes_per_layer(virtual_num_nodes, num_layers, min_num_nodes_per_layer,
-                                                      max_num_nodes_per_layer,num_first_layer, accurate)
-
-    if len(random_integers) == 0:
+    src, dst, sizes = random_dag_arrays(num_nodes, num_layers, min_num_nodes_per_layer, max_num_nodes_per_layer,
+                                        num_first_layer, max_outgoing_edges, accurate, rng)
+    if len(sizes) == 0:
         return [], []
-    # Create the nodes
-    for i in range(num_layers):
-        layer_nodes = []
-        npl = random_integers[i]
-        for j in range(npl):
-            node = node_count
-            layer_nodes.append(node)
-            nodes.append(node)
-            node_count += 1
-
-        # Connect the nodes to the previous layer
-        if i > 0:
-            for node in layer_nodes:
-                # Randomly select outgoing edges for this node
-                num_outgoing_edges = random.randint(1, max_outgoing_edges)
-                if num_outgoing_edges > len(prev_layer_nodes):
-                    num_outgoing_edges = len(prev_layer_nodes)
-                #print("num_outgoing_edges: ", num_outgoing_edges, "prev_layer_nodes: ", prev_layer_nodes)
-                outgoing_edges = random.sample(prev_layer_nodes, num_outgoing_edges)
-                for edge in outgoing_edges:
-                    edges.append((edge, node))
-
-        prev_layer_nodes = layer_nodes
-    
-    nodes.insert(0, 0)
-    for j in range(num_first_layer):
-        edges.append((0, j+1))
-    return nodes, edges
+    nodes = list(range(int(sizes.sum()) + 1))
+    return nodes, list(zip(src.tolist(), dst.tolist()))
 
 
 # Plot the graph
@@ -131,8 +191,11 @@ def draw_graph(nodes, edges):
     for edge in edges:
         G.add_edge(edge[0], edge[1])
 
-    # Plot the graph
-    pos = nx.nx_agraph.graphviz_layout(G, prog="dot")
+    # Plot the graph, graphviz is optional
+    try:
+        pos = nx.nx_agraph.graphviz_layout(G, prog="dot")
+    except ImportError:
+        pos = get_pos_dag(G.edges())
     nx.draw(G, pos, with_labels=True)
     plt.show()
 
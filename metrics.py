@@ -0,0 +1,219 @@
+#!/bin/python3
+
+## Join latency and mesh health metrics of the running simulation, in the Prometheus
+## text format. MeshMetrics follows the topology sampler and updates its counters and
+## histograms from the difference between two snapshots. MetricsExporter writes them
+## to a file every few seconds (e.g. for the textfile collector of node_exporter)
+## and/or serves them on a localhost HTTP endpoint to be scraped.
+
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eui64 import root_index
+from layers import hop_depths
+from recorder import diff_tables, parent_keys
+
+# seconds
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 3600)
+JOINED_PERCENTS = (10, 50, 90, 100)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        out = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            out.append(f"{name}_bucket{_labels(dict(labels, le=str(bound)))} {cumulative}")
+        out.append(f"{name}_sum{_labels(labels)} {self.sum}")
+        out.append(f"{name}_count{_labels(labels)} {self.count}")
+        return out
+
+class MeshMetrics:
+    def __init__(self, total_nodes=None, run_id=None):
+        """
+        :param total_nodes: function returning the number of nodes of the simulated graph,
+                            the border router excluded as it never joins
+        :param run_id: function returning the run ID, exported as a label
+        """
+        self.total_nodes = total_nodes or (lambda: 0)
+        self.run_id = run_id or (lambda: "")
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.start = None # time of the first snapshot, join latencies are counted from it
+        self.joined_at = dict() # EUI-64 key -> latency of its first join
+        self.latency = Histogram()
+        self.latency_by_depth = dict()
+        self.time_to_joined = dict() # percent -> seconds
+        self.connected = 0
+        self.joins = 0
+        self.leaves = 0
+        self.parent_changes = 0
+        self.topology_changes = 0
+        self.up = 0
+        self._prev = None # sorted keys and parent keys of the connected nodes
+
+    def update(self, snapshot):
+        """
+        Subscriber of topology.TopologySampler
+        """
+        with self.lock:
+            if snapshot is None:
+                # simulation stopped, the next topology starts a new run
+                self.up = 0
+                self.connected = 0
+                self._prev = None
+                self.start = None
+                return
+            if self.start is None:
+                self.reset()
+                self.start = snapshot.timestamp
+            self.up = 1
+            self.topology_changes += 1
+            latency = snapshot.timestamp - self.start
+            connected = snapshot.parent >= 0
+            keys = snapshot.keys[connected]
+            pkeys = parent_keys(snapshot.keys, snapshot.parent)[connected]
+            self.connected = len(keys)
+
+            new = [i for i, key in enumerate(keys.tolist()) if key not in self.joined_at]
+            if new:
+                # -1 for the nodes not under the border router
+                depths = hop_depths(snapshot.parent, root_index(snapshot))[connected]
+                for i in new:
+                    self.joined_at[int(keys[i])] = latency
+                    self.latency.observe(latency)
+                    depth = str(int(depths[i]))
+                    self.latency_by_depth.setdefault(depth, Histogram()).observe(latency)
+            total = self.total_nodes()
+            for percent in JOINED_PERCENTS:
+                if percent not in self.time_to_joined and total > 0 and len(self.joined_at) * 100 >= percent * total:
+                    self.time_to_joined[percent] = latency
+
+            if self._prev is None:
+                self.joins += len(keys)
+            else:
+                joined, left, moved = diff_tables(*self._prev, keys, pkeys)
+                self.joins += int(joined.sum())
+                self.leaves += len(left)
+                self.parent_changes += int(moved.sum())
+            self._prev = (keys, pkeys)
+
+    def render(self):
+        """
+        :return: metrics in the Prometheus text exposition format
+        """
+        labels = {'run_id': self.run_id()}
+        total = self.total_nodes()
+        lines = []
+        def metric(name, kind, help, samples):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for extra, value in samples:
+                lines.append(f"{name}{_labels(dict(labels, **extra))} {value}")
+        with self.lock:
+            metric("gmnsim_up", "gauge", "1 while the border router reports a topology", [({}, self.up)])
+            metric("gmnsim_nodes", "gauge", "Nodes of the simulated graph, border router excluded", [({}, total)])
+            metric("gmnsim_connected_nodes", "gauge", "Nodes with a parent in the RPL tree", [({}, self.connected)])
+            metric("gmnsim_joined_nodes", "gauge", "Nodes that joined at least once in this run",
+                   [({}, len(self.joined_at))])
+            metric("gmnsim_joins_total", "counter", "Nodes that got a parent", [({}, self.joins)])
+            metric("gmnsim_leaves_total", "counter", "Nodes that lost their parent", [({}, self.leaves)])
+            metric("gmnsim_parent_changes_total", "counter", "Nodes that changed parent",
+                   [({}, self.parent_changes)])
+            metric("gmnsim_topology_changes_total", "counter", "Topologies seen by the sampler",
+                   [({}, self.topology_changes)])
+            metric("gmnsim_time_to_joined_seconds", "gauge",
+                   "Time until the given percentage of the nodes had joined",
+                   [({'percent': str(p)}, t) for p, t in sorted(self.time_to_joined.items())])
+            lines.append("# HELP gmnsim_join_latency_seconds First join time of the nodes")
+            lines.append("# TYPE gmnsim_join_latency_seconds histogram")
+            lines.extend(self.latency.lines("gmnsim_join_latency_seconds", labels))
+            lines.append("# HELP gmnsim_join_latency_by_depth_seconds First join time of the nodes by hop depth")
+            lines.append("# TYPE gmnsim_join_latency_by_depth_seconds histogram")
+            for depth, histogram in sorted(self.latency_by_depth.items(), key=lambda item: int(item[0])):
+                lines.extend(histogram.lines("gmnsim_join_latency_by_depth_seconds", dict(labels, depth=depth)))
+        return "\n".join(lines) + "\n"
+
+class MetricsExporter:
+    def __init__(self, metrics, filename="", port=0, interval=5.0, host="127.0.0.1"):
+        """
+        :param filename: file rewritten every interval, not written if empty
+        :param port: port of the HTTP endpoint (any path), no endpoint if 0
+        """
+        self.metrics = metrics
+        self.filename = filename
+        self.port = port
+        self.interval = interval
+        self.host = host
+        self.server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self.filename:
+            thread = threading.Thread(target=self._write_loop, name="metrics-file", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.port:
+            metrics = self.metrics
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = metrics.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", CONTENT_TYPE)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+            self.server.daemon_threads = True
+            thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def write(self):
+        # written aside then renamed, a reader never sees a partial file
+        tmp = self.filename + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.metrics.render())
+        os.replace(tmp, self.filename)
+
+    def _write_loop(self):
+        while True:
+            try:
+                self.write()
+            except OSError as e:
+                print("Cannot write the metrics:", e)
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=1)
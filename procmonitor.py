@@ -0,0 +1,148 @@
+#!/bin/python3
+
+## Liveness of the simulator processes without forking pgrep.
+## The PIDs of one simulation instance are resolved from /proc, then each process is
+## tracked through a pidfd: one poll() call tells which of them have exited. /proc is
+## scanned again only while the simulation is starting (until two scans agree), when
+## nothing is running, or after invalidate(). A monitor can be shared between threads.
+
+import os
+import select
+import signal
+import threading
+import time
+
+from confgen import RunPaths
+
+def process_markers(run_id=""):
+    """
+    Text the command line of each process must contain to belong to the instance run_id,
+    None to match by name only
+    """
+    paths = RunPaths(run_id)
+    return {'wssimserver': paths.sim_socket, 'wshwsim': paths.sim_socket,
+            'wsnode': f"storage_prefix={paths.root}/n", 'wsbrd': paths.wsbrd_storage if run_id else None}
+
+def scan_proc(markers):
+    """
+    Walk /proc once
+    :return: dict {pid: name} of the processes matching markers
+    """
+    found = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/comm", "rb") as f:
+                name = f.read().rstrip(b"\n").decode(errors="replace")
+            if name not in markers:
+                continue
+            if markers[name] is not None:
+                with open(f"/proc/{entry}/cmdline", "rb") as f:
+                    cmdline = f.read().replace(b"\0", b" ").decode(errors="replace")
+                if markers[name] not in cmdline:
+                    continue
+        except OSError:
+            continue # exited meanwhile, or not ours to read
+        found[int(entry)] = name
+    return found
+
+class ProcessMonitor:
+    def __init__(self, run_id="", rescan_interval=1.0):
+        self.markers = process_markers(run_id)
+        self.rescan_interval = rescan_interval
+        self.procs = {} # pid -> name
+        self._fds = {} # pid -> pidfd, missing if pidfds are not supported
+        self._poll = select.poll()
+        self._last_scan = 0
+        self._settled = False
+        self._settled_set = set()
+        self._lock = threading.RLock()
+
+    def invalidate(self):
+        """
+        Scan /proc again on next query, e.g. after starting or stopping a simulation
+        """
+        with self._lock:
+            self._last_scan = 0
+            self._settled = False
+
+    def _scan(self):
+        found = scan_proc(self.markers)
+        for pid in set(self.procs) - set(found):
+            self._forget(pid)
+        for pid, name in found.items():
+            if pid in self.procs:
+                continue
+            self.procs[pid] = name
+            try:
+                fd = os.pidfd_open(pid)
+            except (AttributeError, OSError):
+                continue # no pidfd support, /proc/<pid> is checked instead
+            self._fds[pid] = fd
+            self._poll.register(fd, select.POLLIN)
+        self._settled = self._last_scan != 0 and self._settled_set == set(found)
+        self._settled_set = set(found)
+        self._last_scan = time.monotonic()
+
+    def _forget(self, pid):
+        del self.procs[pid]
+        fd = self._fds.pop(pid, None)
+        if fd is not None:
+            self._poll.unregister(fd)
+            os.close(fd)
+
+    def _reap(self):
+        # a pidfd becomes readable when its process exits
+        by_fd = {fd: pid for pid, fd in self._fds.items()}
+        for fd, _event in self._poll.poll(0):
+            self._forget(by_fd[fd])
+        for pid in [pid for pid in self.procs if pid not in self._fds]:
+            if not os.path.exists(f"/proc/{pid}"):
+                self._forget(pid)
+
+    def refresh(self):
+        with self._lock:
+            self._reap()
+            names = set(self.procs.values())
+            if self._settled and 'wssimserver' in names and 'wsbrd' in names:
+                return
+            if time.monotonic() - self._last_scan >= self.rescan_interval:
+                self._scan()
+
+    def pids(self, name):
+        with self._lock:
+            self.refresh()
+            return sorted(pid for pid, n in self.procs.items() if n == name)
+
+    def count(self, name):
+        return len(self.pids(name))
+
+    def running(self):
+        """
+        PID of wssimserver if the simulation is running (wsbrd included), None otherwise
+        """
+        with self._lock:
+            self.refresh()
+            server = [pid for pid, n in self.procs.items() if n == 'wssimserver']
+            if server and 'wsbrd' in self.procs.values():
+                return server[0]
+            return None
+
+    def kill(self, name, sig=signal.SIGKILL):
+        """
+        Signal the tracked processes called name, through their pidfd when possible
+        :return: number of processes signaled
+        """
+        with self._lock:
+            pids = self.pids(name)
+            for pid in pids:
+                try:
+                    if pid in self._fds:
+                        signal.pidfd_send_signal(self._fds[pid], sig)
+                    else:
+                        os.kill(pid, sig)
+                except (ProcessLookupError, PermissionError):
+                    pass
+            self.invalidate()
+            return len(pids)
@@ -0,0 +1,293 @@
+#!/bin/python3
+
+## Append-only binary log of the sampled topology, for long simulation runs.
+## The file starts with a JSON metadata header. Each record then holds one change of the
+## topology: a keyframe with the whole node table every keyframe_every records, and in
+## between a delta with the nodes that joined, left or changed parent since the record
+## before. Records are encoded and written by a thread of their own, the sampler only
+## queues the snapshots.
+##
+## File layout (little-endian):
+##   MAGIC, u32 header length, header (JSON, utf-8)
+##   records: u8 kind, f64 timestamp, u32 seq, u32 payload length, payload
+##   KEYFRAME payload: u32 reported, u32 n, u64 keys[n], i32 parent[n] (index in keys)
+##   DELTA payload: u32 reported, u32 joined, u32 left, u32 moved,
+##                  u64 joined keys, u64 their parent keys, u64 left keys,
+##                  u64 moved keys, u64 their new parent keys
+##   GONE payload: empty, the topology is not available anymore (simulation stopped)
+## A node without parent has NO_PARENT as parent key. A truncated last record (e.g. after
+## a crash) is ignored when reading. Recording gives random access for replays.
+
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from topology import TopologySnapshot
+
+MAGIC = b"GMNREC\x00\x01"
+KEYFRAME = 1
+DELTA = 2
+GONE = 3
+NO_PARENT = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+_HEADER_LEN = struct.Struct('<I')
+_RECORD = struct.Struct('<BdII')
+_KEYFRAME = struct.Struct('<II')
+_DELTA = struct.Struct('<IIII')
+_STOP = object()
+
+Keyframe = namedtuple('Keyframe', ['timestamp', 'seq', 'keys', 'parent', 'reported'])
+Delta = namedtuple('Delta', ['timestamp', 'seq', 'reported', 'joined', 'joined_parent', 'left',
+                             'moved', 'moved_parent'])
+Gone = namedtuple('Gone', ['timestamp', 'seq'])
+
+def parent_keys(keys, parent):
+    """
+    EUI-64 key of the parent of every node, NO_PARENT for the roots
+    """
+    pkeys = np.full(len(keys), NO_PARENT, dtype=np.uint64)
+    placed = parent >= 0
+    pkeys[placed] = keys[parent[placed]]
+    return pkeys
+
+def encode_keyframe(keys, parent, reported):
+    return (_KEYFRAME.pack(reported, len(keys)) + keys.astype('<u8').tobytes()
+            + parent.astype('<i4').tobytes())
+
+def diff_tables(prev_keys, prev_pkeys, keys, pkeys):
+    """
+    Changes from the previous table to the new one, both with sorted keys
+    :return: mask of the new keys that joined, keys that left, mask of the new keys whose parent changed
+    """
+    joined = ~np.isin(keys, prev_keys, assume_unique=True)
+    left = prev_keys[~np.isin(prev_keys, keys, assume_unique=True)]
+    moved = np.zeros(len(keys), dtype=bool)
+    moved[~joined] = prev_pkeys[np.searchsorted(prev_keys, keys[~joined])] != pkeys[~joined]
+    return joined, left, moved
+
+def encode_delta(prev_keys, prev_pkeys, keys, pkeys, reported):
+    joined, left, moved = diff_tables(prev_keys, prev_pkeys, keys, pkeys)
+    return (_DELTA.pack(reported, int(joined.sum()), len(left), int(moved.sum()))
+            + b"".join(a.astype('<u8').tobytes()
+                       for a in (keys[joined], pkeys[joined], left, keys[moved], pkeys[moved])))
+
+def decode_record(kind, timestamp, seq, payload):
+    if kind == KEYFRAME:
+        reported, n = _KEYFRAME.unpack_from(payload)
+        start = _KEYFRAME.size
+        keys = np.frombuffer(payload, dtype='<u8', count=n, offset=start).astype(np.uint64)
+        parent = np.frombuffer(payload, dtype='<i4', count=n, offset=start + 8 * n).astype(np.int32)
+        return Keyframe(timestamp, seq, keys, parent, reported)
+    if kind == DELTA:
+        reported, joined, left, moved = _DELTA.unpack_from(payload)
+        arrays = np.frombuffer(payload, dtype='<u8', offset=_DELTA.size).astype(np.uint64)
+        bounds = np.cumsum([0, joined, joined, left, moved, moved])
+        parts = [arrays[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        return Delta(timestamp, seq, reported, *parts)
+    if kind == GONE:
+        return Gone(timestamp, seq)
+    raise ValueError(f"Unknown record kind {kind}")
+
+def read_header(f):
+    """
+    :return: metadata dict, the file is left at the first record
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a topology recording")
+    (length,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+    return json.loads(f.read(length).decode())
+
+def read_records(f):
+    """
+    Records from the current position of f
+    :return: iterator of (file offset, Keyframe | Delta | Gone)
+    """
+    while True:
+        offset = f.tell()
+        head = f.read(_RECORD.size)
+        if len(head) < _RECORD.size:
+            return
+        kind, timestamp, seq, length = _RECORD.unpack(head)
+        payload = f.read(length)
+        if len(payload) < length:
+            return
+        yield offset, decode_record(kind, timestamp, seq, payload)
+
+def read_log(filename):
+    """
+    :return: metadata dict and list of the records of a recording
+    """
+    with open(filename, 'rb') as f:
+        metadata = read_header(f)
+        return metadata, [record for _offset, record in read_records(f)]
+
+class TopologyRecorder:
+    def __init__(self, filename, metadata=None, keyframe_every=100):
+        """
+        :param filename: recording to create
+        :param metadata: dict stored in the header (run ID, number of nodes, ...)
+        :param keyframe_every: records between two keyframes
+        """
+        self.filename = filename
+        self.keyframe_every = keyframe_every
+        self._file = open(filename, 'xb')
+        header = json.dumps(dict(metadata or {}, format=1, keyframe_every=keyframe_every)).encode()
+        self._file.write(MAGIC + _HEADER_LEN.pack(len(header)) + header)
+        self._file.flush()
+        self._queue = queue.SimpleQueue()
+        self._prev = None # keys and parent keys of the last record, None after GONE
+        self._since_keyframe = 0
+        self._thread = threading.Thread(target=self._run, name="topology-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, snapshot):
+        """
+        Queue a topology.TopologySnapshot, None when the topology is gone. Never blocks.
+        """
+        self._queue.put((snapshot, time.time()))
+
+    def close(self, wait=True):
+        """
+        Write the queued snapshots and close the file
+        :param wait: return only once the file is closed
+        """
+        self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+
+    def _run(self):
+        try:
+            stop = False
+            while not stop:
+                # write everything queued, then flush once
+                item = self._queue.get()
+                while True:
+                    if item is _STOP:
+                        stop = True
+                        break
+                    self._file.write(self._encode(*item))
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                self._file.flush()
+        finally:
+            self._file.close()
+
+    def _encode(self, snapshot, now):
+        if snapshot is None:
+            self._prev = None
+            return _RECORD.pack(GONE, now, 0, 0)
+        pkeys = parent_keys(snapshot.keys, snapshot.parent)
+        if self._prev is None or self._since_keyframe >= self.keyframe_every:
+            kind = KEYFRAME
+            payload = encode_keyframe(snapshot.keys, snapshot.parent, snapshot.reported)
+            self._since_keyframe = 0
+        else:
+            kind = DELTA
+            payload = encode_delta(*self._prev, snapshot.keys, pkeys, snapshot.reported)
+        self._since_keyframe += 1
+        self._prev = (snapshot.keys, pkeys)
+        return _RECORD.pack(kind, snapshot.timestamp, snapshot.seq, len(payload)) + payload
+
+def apply_delta(keys, pkeys, delta):
+    """
+    Node keys and parent keys after a Delta record, keys stay sorted
+    """
+    keep = ~np.isin(keys, delta.left, assume_unique=True)
+    keys, pkeys = keys[keep], pkeys[keep]
+    pkeys[np.searchsorted(keys, delta.moved)] = delta.moved_parent
+    keys = np.concatenate((keys, delta.joined))
+    pkeys = np.concatenate((pkeys, delta.joined_parent))
+    order = np.argsort(keys, kind='stable')
+    return keys[order], pkeys[order]
+
+class Recording:
+    def __init__(self, filename):
+        """
+        Random access to a recording. The index holds the time and file offset of every
+        record: seeking bisects it, then reads the keyframe before the record and
+        applies the deltas up to it.
+        """
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        self.metadata = read_header(self._file)
+        size = os.fstat(self._file.fileno()).st_size
+        times, offsets, kinds = [], [], []
+        offset = self._file.tell()
+        while offset + _RECORD.size <= size:
+            kind, timestamp, _seq, length = _RECORD.unpack(self._file.read(_RECORD.size))
+            if offset + _RECORD.size + length > size:
+                break # truncated last record
+            times.append(timestamp)
+            offsets.append(offset)
+            kinds.append(kind)
+            offset += _RECORD.size + length
+            self._file.seek(offset)
+        self.times = np.array(times, dtype=np.float64)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.kinds = np.array(kinds, dtype=np.uint8)
+        self.keyframes = np.flatnonzero(self.kinds == KEYFRAME)
+        # last reconstructed record: index, keys, parent keys, so that playing forward
+        # only applies the new deltas
+        self._state = None
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def start(self):
+        return float(self.times[0]) if len(self.times) else 0.0
+
+    @property
+    def end(self):
+        return float(self.times[-1]) if len(self.times) else 0.0
+
+    def index_at(self, timestamp):
+        """
+        Index of the last record at or before timestamp, -1 if none
+        """
+        return int(np.searchsorted(self.times, timestamp, side='right')) - 1
+
+    def snapshot_at(self, timestamp):
+        """
+        :return: topology.TopologySnapshot in effect at timestamp, None if there was no topology
+        """
+        return self.snapshot(self.index_at(timestamp))
+
+    def snapshot(self, index):
+        if index < 0 or self.kinds[index] == GONE:
+            return None
+        keyframe = int(self.keyframes[np.searchsorted(self.keyframes, index, side='right') - 1])
+        if self._state is not None and keyframe <= self._state[0] <= index:
+            position, keys, pkeys = self._state
+        else:
+            position = keyframe
+            record = self._read(keyframe, 1)[0]
+            keys, pkeys = record.keys, parent_keys(record.keys, record.parent)
+        records = self._read(position, index - position + 1)
+        for delta in records[1:]:
+            keys, pkeys = apply_delta(keys, pkeys, delta)
+        self._state = (index, keys, pkeys)
+        record = records[-1]
+        parent = np.full(len(keys), -1, dtype=np.int32)
+        placed = pkeys != NO_PARENT
+        parent[placed] = np.searchsorted(keys, pkeys[placed])
+        # shared with the next reconstruction, which never modifies them
+        keys.flags.writeable = False
+        parent.flags.writeable = False
+        return TopologySnapshot(record.seq, record.timestamp, keys, parent, record.reported)
+
+    def _read(self, index, count):
+        self._file.seek(self.offsets[index])
+        records = read_records(self._file)
+        return [next(records)[1] for _ in range(count)]
+
+    def close(self):
+        self._file.close()
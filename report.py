@@ -0,0 +1,287 @@
+#!/bin/python3
+
+## Reports of recorded runs (see recorder), without a display.
+## Example:
+##   python report.py recordings/*.gmnrec --out reports/batch1 --jobs 8
+## Every run is analysed and its figures (connection time, hop depth, churn, final
+## topology) are rendered with the Agg backend in a worker process. The report is one
+## self-contained HTML file, figures embedded, with CSV tables of every run next to it
+## and a summary of all the runs.
+
+import argparse
+import base64
+import csv
+import html
+import io
+import os
+import sys
+import time
+from multiprocessing import get_context
+
+import numpy as np
+
+from eui64 import NodeTable, format_eui64, node_labels, root_index
+from layers import hop_depths, layer_stats
+from recorder import Recording, diff_tables, parent_keys
+from treelayout import tidy_tree_layout
+
+JOINED_PERCENTS = (50, 90, 100)
+FIGURES = ('connection_time', 'depth', 'churn', 'topology')
+
+def analyse_run(filename):
+    """
+    Join time and depth of every node, and the churn over time, of a recording
+    :return: dict
+    """
+    recording = Recording(filename)
+    try:
+        start = recording.start
+        joined = dict() # key -> (join time, hop depth when joining)
+        churn = [] # (time, connected, joins, leaves, parent changes)
+        prev = None
+        last = None
+        for i in range(len(recording)):
+            t = float(recording.times[i]) - start
+            snapshot = recording.snapshot(i)
+            if snapshot is None:
+                # simulation stopped, not counted as leaves
+                churn.append((t, 0, 0, 0, 0))
+                prev = None
+                continue
+            last = snapshot
+            connected = snapshot.parent >= 0
+            keys = snapshot.keys[connected]
+            pkeys = parent_keys(snapshot.keys, snapshot.parent)[connected]
+            new = [j for j, key in enumerate(keys.tolist()) if key not in joined]
+            if new:
+                depths = hop_depths(snapshot.parent, root_index(snapshot))[connected]
+                for j in new:
+                    joined[int(keys[j])] = (t, int(depths[j]))
+            if prev is None:
+                churn.append((t, len(keys), len(keys), 0, 0))
+            else:
+                new_keys, left, moved = diff_tables(*prev, keys, pkeys)
+                churn.append((t, len(keys), int(new_keys.sum()), len(left), int(moved.sum())))
+            prev = (keys, pkeys)
+    finally:
+        recording.close()
+
+    # border router excluded, it never joins
+    total = int(recording.metadata.get('total_nodes') or 0) or len(joined)
+    nodes = sorted(joined.items(), key=lambda item: item[1][0])
+    times = np.array([t for _key, (t, _d) in nodes])
+    time_to = {}
+    for percent in JOINED_PERCENTS:
+        count = -(-percent * total // 100) # ceil
+        time_to[percent] = float(times[count - 1]) if total and len(times) >= count else None
+    return {
+        'name': os.path.splitext(os.path.basename(filename))[0],
+        'filename': filename,
+        'metadata': recording.metadata,
+        'duration': recording.end - start,
+        'total_nodes': total,
+        'nodes': [(key, int(node_labels([key])[0]), t, d) for key, (t, d) in nodes],
+        'depths': layer_stats([d for _key, (_t, d) in nodes], times),
+        'churn': churn,
+        'time_to': time_to,
+        'parent_changes': sum(c[4] for c in churn),
+        'leaves': sum(c[3] for c in churn),
+        'last': None if last is None else (last.keys, last.parent),
+    }
+
+def _png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=90)
+    return buf.getvalue()
+
+def render_figures(run):
+    """
+    :return: dict {figure name: PNG bytes}
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    figures = dict()
+    labels = [label for _key, label, _t, _d in run['nodes']]
+    times = [t for _key, _label, t, _d in run['nodes']]
+
+    fig, ax = plt.subplots(figsize=(10, 4))
+    ax.bar(labels, times, color=plt.get_cmap('Blues')(np.linspace(0.2, 0.9, len(labels))))
+    ax.set_xlabel('Node index')
+    ax.set_ylabel('Connection time (s)')
+    ax.set_title('Connection time for each node')
+    ax.yaxis.grid(True, color='#EEEEEE')
+    ax.set_axisbelow(True)
+    figures['connection_time'] = _png(fig)
+    plt.close(fig)
+
+    fig, ax = plt.subplots(figsize=(10, 4))
+    depths = np.array([d for _key, _label, _t, d in run['nodes']])
+    in_tree = depths >= 0
+    ax.scatter(depths[in_tree], np.array(times)[in_tree], c=depths[in_tree], cmap='viridis', alpha=0.6)
+    if run['depths']:
+        layer_depths = [layer.depth for layer in run['depths']]
+        ax.plot(layer_depths, [layer.min for layer in run['depths']], 'v--', color='grey', label='min')
+        ax.plot(layer_depths, [layer.median for layer in run['depths']], 'o-', color='black', label='median')
+        ax.plot(layer_depths, [layer.p95 for layer in run['depths']], '^--', color='red', label='p95')
+        ax.set_xticks(layer_depths)
+        ax.legend()
+    ax.set_xlabel('Hop depth')
+    ax.set_ylabel('Connection time (s)')
+    ax.set_title('Connection time by hop depth')
+    ax.grid(True, color='#EEEEEE')
+    figures['depth'] = _png(fig)
+    plt.close(fig)
+
+    fig, (ax, bx) = plt.subplots(2, 1, figsize=(10, 6), sharex=True)
+    churn = np.array(run['churn'], dtype=float).reshape(-1, 5)
+    ax.step(churn[:, 0], churn[:, 1], where='post')
+    ax.set_ylabel('Connected nodes')
+    ax.set_title('Churn')
+    ax.grid(True, color='#EEEEEE')
+    for column, name in ((2, 'joins'), (3, 'leaves'), (4, 'parent changes')):
+        bx.step(churn[:, 0], np.cumsum(churn[:, column]), where='post', label=name)
+    bx.set_xlabel('Time (s)')
+    bx.set_ylabel('Cumulative count')
+    bx.legend()
+    bx.grid(True, color='#EEEEEE')
+    figures['churn'] = _png(fig)
+    plt.close(fig)
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    if run['last'] is not None:
+        keys, parent = run['last']
+        root = root_index(NodeTable(keys, parent, len(keys)))
+        xy = tidy_tree_layout(parent, root)
+        xy[:, 1] = -xy[:, 1]
+        placed = ~np.isnan(xy[:, 0])
+        child = np.flatnonzero(placed & (parent >= 0))
+        ax.add_collection(LineCollection(np.stack((xy[child], xy[parent[child]]), axis=1), colors='#222', linewidths=1))
+        colors = np.where(np.arange(len(keys)) == root, 'green', 'grey')
+        ax.scatter(xy[placed, 0], xy[placed, 1], c=colors[placed], s=60 if placed.sum() <= 150 else 10, zorder=2)
+        if placed.sum() <= 150:
+            node_label = node_labels(keys)
+            for i in np.flatnonzero(placed).tolist():
+                ax.annotate("BR" if i == root else str(node_label[i]), xy[i], ha='center', va='center',
+                            fontsize=6, color='white', zorder=3)
+    ax.set_axis_off()
+    ax.set_title('Final RPL tree')
+    figures['topology'] = _png(fig)
+    plt.close(fig)
+    return figures
+
+def _report_one(filename):
+    # worker process: any failure is reported instead of stopping the batch
+    try:
+        run = analyse_run(filename)
+        return run, render_figures(run), None
+    except Exception as e:
+        return {'name': os.path.splitext(os.path.basename(filename))[0], 'filename': filename}, {}, repr(e)
+
+def write_csv(filename, header, rows):
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+def write_run_tables(run, out_dir):
+    """
+    :return: names of the CSV files written
+    """
+    name = run['name']
+    files = [f"{name}_nodes.csv", f"{name}_depths.csv", f"{name}_churn.csv"]
+    write_csv(os.path.join(out_dir, files[0]), ['eui64', 'node', 'join_time_s', 'hop_depth'],
+              [(format_eui64(key), label, f"{t:.3f}", d) for key, label, t, d in run['nodes']])
+    write_csv(os.path.join(out_dir, files[1]), ['hop_depth', 'nodes', 'min_s', 'median_s', 'p95_s'],
+              [(s.depth, s.count, f"{s.min:.3f}", f"{s.median:.3f}", f"{s.p95:.3f}") for s in run['depths']])
+    write_csv(os.path.join(out_dir, files[2]), ['time_s', 'connected', 'joins', 'leaves', 'parent_changes'],
+              [(f"{c[0]:.3f}",) + tuple(c[1:]) for c in run['churn']])
+    return files
+
+def _seconds(value):
+    return "" if value is None else f"{value:.1f}"
+
+SUMMARY_HEADER = ['run', 'run_id', 'duration_s', 'nodes', 'joined', 'max_depth',
+                  'time_to_50_s', 'time_to_90_s', 'time_to_100_s', 'leaves', 'parent_changes', 'error']
+
+def summary_row(run, error):
+    if error:
+        return [run['name']] + [""] * (len(SUMMARY_HEADER) - 2) + [error]
+    return [run['name'], run['metadata'].get('run_id', ""), _seconds(run['duration']), run['total_nodes'],
+            len(run['nodes']), max((s.depth for s in run['depths']), default=""),
+            _seconds(run['time_to'][50]), _seconds(run['time_to'][90]), _seconds(run['time_to'][100]),
+            run['leaves'], run['parent_changes'], ""]
+
+def _table(header, rows):
+    head = "".join(f"<th>{html.escape(str(h))}</th>" for h in header)
+    body = "".join("<tr>" + "".join(f"<td>{html.escape(str(v))}</td>" for v in row) + "</tr>" for row in rows)
+    return f"<table><tr>{head}</tr>{body}</table>"
+
+def make_report(filenames, out_dir, jobs=None, title="GMNsim report"):
+    """
+    Analyse the recordings in a process pool and write report.html and the CSV tables
+    :return: path of the HTML report
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    results = dict()
+    start = time.time()
+    # spawn: safe from a GUI process with threads, the workers only need this module
+    with get_context('spawn').Pool(jobs) as pool:
+        for done, (run, figures, error) in enumerate(pool.imap_unordered(_report_one, filenames), 1):
+            results[run['filename']] = (run, figures, error)
+            print(f"{done}/{len(filenames)} runs, {time.time() - start:.1f} s" + (f", {run['name']}: {error}" if error else ""))
+
+    summary = []
+    sections = []
+    for filename in filenames:
+        run, figures, error = results[filename]
+        summary.append(summary_row(run, error))
+        section = [f"<h2 id=\"{html.escape(run['name'])}\">{html.escape(run['name'])}</h2>"]
+        if error:
+            section.append(f"<p class=\"error\">{html.escape(error)}</p>")
+        else:
+            files = write_run_tables(run, out_dir)
+            section.append("<p>" + " · ".join(f"<a href=\"{html.escape(f)}\">{html.escape(f)}</a>" for f in files) + "</p>")
+            section.append(_table(['hop depth', 'nodes', 'min (s)', 'median (s)', 'p95 (s)'],
+                                  [(s.depth, s.count, f"{s.min:.1f}", f"{s.median:.1f}", f"{s.p95:.1f}")
+                                   for s in run['depths']]))
+            for name in FIGURES:
+                data = base64.b64encode(figures[name]).decode()
+                section.append(f"<img alt=\"{name}\" src=\"data:image/png;base64,{data}\">")
+        sections.append("\n".join(section))
+    write_csv(os.path.join(out_dir, "summary.csv"), SUMMARY_HEADER, summary)
+
+    filename = os.path.join(out_dir, "report.html")
+    with open(filename, "w") as f:
+        f.write(f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin: 1em 0; }}
+td, th {{ border: 1px solid #ccc; padding: 2px 8px; text-align: right; }}
+img {{ display: block; max-width: 100%; margin: 1em 0; }}
+.error {{ color: #a0042a; }}
+</style></head><body>
+<h1>{html.escape(title)}</h1>
+<p>{len(filenames)} runs, generated {time.strftime("%Y-%m-%d %H:%M:%S")}. <a href="summary.csv">summary.csv</a></p>
+{_table(SUMMARY_HEADER, summary)}
+{"".join(sections)}
+</body></html>
+""")
+    return filename
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create a report of recorded runs, no display needed")
+    parser.add_argument('recordings', nargs='+', help="topology recordings (.gmnrec)")
+    parser.add_argument('--out', default='reports', type=str, help="output directory")
+    parser.add_argument('--jobs', default=None, type=int, help="worker processes (default: all cores)")
+    parser.add_argument('--title', default="GMNsim report", type=str)
+    args = parser.parse_args(argv)
+    filename = make_report(args.recordings, args.out, args.jobs, args.title)
+    print("Report written to", filename)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
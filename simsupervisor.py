@@ -0,0 +1,247 @@
+#!/bin/python3
+
+## Headless simulation supervisor.
+## Runs wssimserver, one wshwsim and one wsnode per node, and wsbrd as direct child
+## processes sharing one process group, instead of one terminal emulator per process.
+## Output of the logged nodes goes to files in the log directory.
+## Usage: python simsupervisor.py --dir <simulator dir> --graph last.graph [--log 1,5,6]
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+from confgen import DBUS_CONF_SCRIPT, RunPaths, tun_script, tpg_args, node_mac, is_logged
+
+class SimSupervisor:
+    """
+    Starts and stops one simulation. The coroutines run on an asyncio loop, either the
+    caller's one or a private loop in a background thread (start_background).
+    """
+    def __init__(self, num_nodes, edges, dir, cleanup=True, add_tun=True, tunip=None,
+                 log_nano=False, log_radio=False, be_logged_nodes=[], log_dir="sim_logs",
+                 concurrency=16, ready_timeout=30, run_id=""):
+        self.num_nodes = num_nodes
+        self.edges = edges
+        self.dir = dir
+        self.cleanup = cleanup
+        self.add_tun = add_tun
+        self.tunip = tunip
+        self.log_nano = log_nano
+        self.log_radio = log_radio
+        self.be_logged_nodes = be_logged_nodes
+        self.paths = RunPaths(run_id)
+        if run_id != "":
+            log_dir = os.path.join(log_dir, run_id)
+        self.log_dir = os.path.abspath(log_dir)
+        self.concurrency = concurrency
+        self.ready_timeout = ready_timeout
+        self.sudo = [] if os.geteuid() == 0 else ["sudo"]
+        self.pgids = [] # process groups of the simulation, one unless before Python 3.11
+        self.processes = {}
+        self._loop = None
+        self._thread = None
+
+    def check_sudo(self):
+        """
+        wsbrd, the TUN interface and the D-Bus rule need root. There is no terminal to
+        answer a password prompt, so sudo must work without one (NOPASSWD).
+        :raise PermissionError: not root and sudo asks for a password
+        """
+        if not self.sudo:
+            return
+        try:
+            allowed = subprocess.run(["sudo", "-n", "true"], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.DEVNULL).returncode == 0
+        except FileNotFoundError:
+            allowed = False
+        if not allowed:
+            raise PermissionError("Headless simulations need root or passwordless sudo (NOPASSWD), "
+                                  "sudo is missing or asks for a password")
+
+    def prepare(self):
+        """
+        Cleanup of /tmp, TUN interface and D-Bus rule file, as in the runscript
+        """
+        script = "#!/bin/bash\n"
+        if self.cleanup:
+            script += self.paths.cleanup_script()
+        script += f"mkdir -p {self.paths.wsbrd_storage}\n"
+        if self.add_tun:
+            script += tun_script(self.tunip, self.paths.tun)
+        script += DBUS_CONF_SCRIPT
+        subprocess.run(["bash", "-c", script], cwd=self.dir)
+
+    async def start(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.check_sudo)
+        await asyncio.get_running_loop().run_in_executor(None, self.prepare)
+        os.makedirs(self.log_dir, exist_ok=True)
+        try:
+            self._remove(self.paths.sim_socket)
+            await self._spawn("wssimserver", [f"{self.dir}/wssimserver", *tpg_args(self.edges),
+                                              self.paths.sim_socket, "--dump", "-f"], True)
+            await self._wait_ready(self.paths.sim_socket)
+            # Nodes are brought up concurrently, at most "concurrency" of them at a time
+            sem = asyncio.Semaphore(self.concurrency)
+            await asyncio.gather(*(self._start_node(i, sem) for i in range(self.num_nodes)))
+            wsbrd = await self._spawn("wsbrd", [*self.sudo, f"{self.dir}/wsbrd", "-F", f"{self.dir}/examples/wsbrd.conf",
+                                                "-u", os.readlink(self.paths.uart(0)), *self.paths.wsbrd_args()], True)
+            # a border router that cannot start (sudo refused, bad configuration) exits at once
+            try:
+                await asyncio.wait_for(wsbrd.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                raise RuntimeError(f"wsbrd exited with code {wsbrd.returncode}, "
+                                   f"see {os.path.join(self.log_dir, 'wsbrd.log')}")
+        except Exception:
+            await self.astop()
+            raise
+
+    async def _start_node(self, i, sem):
+        async with sem:
+            # a stale link from a previous run would pass the readiness check
+            uart = self.paths.uart(i)
+            self._remove(uart)
+            await self._spawn(f"wshwsim_{i}", [f"{self.dir}/wshwsim", "-m", node_mac(i), uart, self.paths.sim_socket],
+                              is_logged(i, self.log_radio, self.be_logged_nodes))
+            await self._wait_ready(uart)
+            if i == 0:
+                return # node 0 is the border router, started last
+            await self._spawn(f"wsnode_{i}", [f"{self.dir}/wsnode", "-F", f"{self.dir}/examples/wsnode.conf",
+                                              "-u", os.readlink(uart), "-o", f"storage_prefix={self.paths.node_storage(i)}"],
+                              is_logged(i, self.log_nano, self.be_logged_nodes))
+
+    async def _spawn(self, name, cmd, logged):
+        out = open(os.path.join(self.log_dir, f"{name}.log"), "wb") if logged else asyncio.subprocess.DEVNULL
+        if sys.version_info >= (3, 11):
+            # the first process leads the group of the whole simulation (0: its own pid)
+            group = {'process_group': self.pgids[0] if self.pgids else 0}
+        else:
+            # joining a group needs preexec_fn, which is not safe with threads: every
+            # process leads a session of its own instead
+            group = {'start_new_session': True}
+        try:
+            proc = await asyncio.create_subprocess_exec(*cmd, cwd=self.dir, stdin=asyncio.subprocess.DEVNULL,
+                                                        stdout=out, stderr=asyncio.subprocess.STDOUT, **group)
+        finally:
+            if logged:
+                out.close()
+        if not self.pgids or 'start_new_session' in group:
+            self.pgids.append(proc.pid)
+        self.processes[name] = proc
+        return proc
+
+    async def _wait_ready(self, path):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.ready_timeout
+        while not os.path.lexists(path):
+            if loop.time() > deadline:
+                raise TimeoutError(f"{path} did not appear within {self.ready_timeout} s")
+            await asyncio.sleep(0.05)
+
+    def _remove(self, path):
+        if os.path.lexists(path):
+            os.remove(path)
+
+    async def astop(self, timeout=5):
+        """
+        Terminate the whole process group, killing what is left after timeout seconds
+        """
+        if not self.pgids:
+            return
+        procs = list(self.processes.values())
+        self._killpgs(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in procs)), timeout)
+        except asyncio.TimeoutError:
+            self._killpgs(signal.SIGKILL)
+            await asyncio.gather(*(p.wait() for p in procs))
+        self.processes.clear()
+        self.pgids = []
+
+    def _killpgs(self, sig):
+        for pgid in self.pgids:
+            try:
+                os.killpg(pgid, sig)
+            except ProcessLookupError:
+                pass
+
+    def is_running(self):
+        return any(p.returncode is None for p in self.processes.values())
+
+    def pids(self):
+        return {name: p.pid for name, p in self.processes.items() if p.returncode is None}
+
+    def start_background(self):
+        """
+        Start the simulation from a loop in a background thread, e.g. from the GUI
+        :return: concurrent.futures.Future of the start
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="sim-supervisor", daemon=True)
+            self._thread.start()
+        return asyncio.run_coroutine_threadsafe(self.start(), self._loop)
+
+    def stop(self, timeout=10):
+        """
+        Stop a simulation started with start_background, blocks until it is torn down
+        """
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.astop(), self._loop).result(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+
+async def _run_until_signal(supervisor):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    starting = asyncio.ensure_future(supervisor.start())
+    stopping = asyncio.ensure_future(stop.wait())
+    await asyncio.wait([starting, stopping], return_when=asyncio.FIRST_COMPLETED)
+    if starting.done():
+        starting.result()
+        print(f"Simulation running with {len(supervisor.pids())} processes, Ctrl+C to stop")
+        await stopping
+    else:
+        # interrupted while the nodes were still starting
+        starting.cancel()
+    await supervisor.astop()
+
+def main(argv=None):
+    from batchgen import read_graph_file
+
+    parser = argparse.ArgumentParser(description="Run a simulation without terminal windows")
+    parser.add_argument('--dir', required=True, help="directory of the simulator executables")
+    parser.add_argument('--graph', default='last.graph', help="graph exported by the GUI")
+    parser.add_argument('--log', default='', help="comma separated node indices to log, empty for all")
+    parser.add_argument('--log-nano', action='store_true', help="log the IP stack (wsnode)")
+    parser.add_argument('--log-radio', action='store_true', help="log MAC/RF (wshwsim)")
+    parser.add_argument('--log-dir', default='sim_logs')
+    parser.add_argument('--no-cleanup', action='store_true', help="keep the files of the previous run in /tmp")
+    parser.add_argument('--no-tun', action='store_true', help="do not create the TUN interface")
+    parser.add_argument('--tunip', default=None)
+    parser.add_argument('--concurrency', default=16, type=int, help="nodes started at the same time")
+    parser.add_argument('--run-id', default='', help="instance namespace, to run several simulations side by side")
+    args = parser.parse_args(argv)
+
+    num_nodes, edges = read_graph_file(args.graph)
+    be_logged = args.log.split(",") if args.log else []
+    supervisor = SimSupervisor(num_nodes, edges, os.path.abspath(args.dir), not args.no_cleanup, not args.no_tun,
+                               args.tunip, args.log_nano, args.log_radio, be_logged, args.log_dir, args.concurrency,
+                               run_id=args.run_id)
+    asyncio.run(_run_until_signal(supervisor))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+#!/bin/python3
+
+## Check the GUI startup import cost with `python -X importtime`.
+## Usage: python startup_budget.py [budget_ms]
+## Exits with 1 if importing main.py takes longer than the budget, or if it pulls in
+## any module that must only be loaded on first use.
+
+import os
+import subprocess
+import sys
+
+# Measured 70-105 ms on a cold interpreter without bytecode cache (tkinter ~9 ms)
+_BUDGET_MS = 150
+_LAZY_MODULES = ('dbus', 'numpy', 'matplotlib', 'sklearn', 'scipy', 'networkx',
+                 'daggen', 'managed_daggen', 'simsupervisor', 'brclient', 'eui64', 'recorder', 'layers', 'metrics', 'report')
+
+def measure_imports(module='main'):
+    """
+    Run a fresh interpreter importing module
+    :return: dict {imported module: cumulative import time in us}
+    """
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    times = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+def check_budget(budget_ms=_BUDGET_MS):
+    times = measure_imports()
+    total_ms = times['main'] / 1000
+    eager = sorted(m for m in times if m.split('.')[0] in _LAZY_MODULES)
+    print(f"main imported in {total_ms:.1f} ms (budget {budget_ms} ms)")
+    if eager:
+        print("Imported at startup but should be lazy:", ", ".join(eager))
+    return total_ms <= budget_ms and not eager
+
+if __name__ == "__main__":
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else _BUDGET_MS
+    sys.exit(0 if check_budget(budget) else 1)
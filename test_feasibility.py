@@ -0,0 +1,45 @@
+#!/bin/python3
+
+## Every parameter set that check_managed_params accepts must be generated by random_dag_arrays.
+## Run with: python -m pytest test_feasibility.py
+
+import itertools
+
+import numpy as np
+
+from feasibility import check_managed_params
+from managed_daggen import random_dag_arrays
+
+def feasible_configs():
+    for accurate in (False, True):
+        for num_nodes, num_layers, min_npl, num_first_layer in itertools.product(
+                range(2, 21), range(1, 6), range(1, 5), range(1, 7)):
+            for max_npl in range(min_npl, 7):
+                params = (num_nodes, num_layers, min_npl, max_npl, num_first_layer)
+                if check_managed_params(*params, accurate).feasible:
+                    yield params, accurate
+
+def test_feasible_configs_are_generated():
+    rng = np.random.default_rng(0)
+    count = 0
+    single_layer = 0
+    for params, accurate in feasible_configs():
+        num_nodes, num_layers = params[0], params[1]
+        src, dst, sizes = random_dag_arrays(*params, 3, accurate, rng)
+        assert len(sizes) == num_layers, (params, accurate)
+        assert sizes.sum() == num_nodes - 1, (params, accurate)
+        # every node but the border router has a parent with a smaller id
+        assert set(dst.tolist()) == set(range(1, num_nodes)), (params, accurate)
+        assert (src < dst).all(), (params, accurate)
+        count += 1
+        single_layer += num_layers == 1
+    assert count > 0 and single_layer > 0
+
+def test_single_layer_takes_all_nodes():
+    # accepted only when N/L1 is the whole layer
+    assert not check_managed_params(11, 1, 1, 20, 4, accurate=False).feasible
+    assert check_managed_params(11, 1, 1, 20, 10, accurate=False).feasible
+    # called directly, the generator does not fail either
+    src, dst, sizes = random_dag_arrays(11, 1, 1, 20, 4, 3, False, 0)
+    assert sizes.tolist() == [10]
+    assert sorted(dst.tolist()) == list(range(1, 11))
@@ -0,0 +1,74 @@
+#!/bin/python3
+
+## Blocking work (D-Bus, /proc, layouts, process teardown) off the Tk thread.
+## Functions run on a worker thread; their results come back through a thread-safe
+## queue that a short after() tick drains on the Tk thread, so callbacks can touch
+## widgets and the UI never waits for the simulator.
+
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class TkBridge:
+    def __init__(self, root, workers=1, drain_ms=20, budget_ms=8):
+        """
+        :param root: Tk root, or any widget with after()
+        :param workers: worker threads, 1 keeps the submitted work in order
+        :param drain_ms: period of the drain tick
+        :param budget_ms: time after which a drain tick leaves the remaining results for the next one
+        """
+        self.root = root
+        self.drain_ms = drain_ms
+        self.budget = budget_ms / 1000
+        self._results = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tk-bridge")
+        # long jobs (e.g. reports) get their own threads, they never delay the regular work
+        self._long_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tk-bridge-long")
+        self._closed = False
+        self.root.after(self.drain_ms, self._drain)
+
+    def submit(self, function, *args, callback=None, errback=None, long=False):
+        """
+        Run function(*args) on the worker, then callback(result) or errback(exception) on the Tk thread
+        :param long: run on a separate thread, for jobs of several seconds or more
+        :return: concurrent.futures.Future
+        """
+        future = (self._long_executor if long else self._executor).submit(function, *args)
+        return self.watch(future, callback, errback)
+
+    def watch(self, future, callback=None, errback=None):
+        """
+        Call callback(result) or errback(exception) on the Tk thread once a future from
+        elsewhere (e.g. another event loop) is done
+        """
+        future.add_done_callback(lambda f: self._results.put((f, callback, errback)))
+        return future
+
+    def _drain(self):
+        start = time.monotonic()
+        while time.monotonic() - start < self.budget:
+            try:
+                future, callback, errback = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if future.cancelled():
+                continue
+            error = future.exception()
+            try:
+                if error is not None:
+                    if errback is not None:
+                        errback(error)
+                    else:
+                        print("Background task failed:", repr(error))
+                elif callback is not None:
+                    callback(future.result())
+            except Exception as e:
+                # a failing callback must not stop the drain tick
+                print("Callback failed:", repr(e))
+        if not self._closed:
+            self.root.after(self.drain_ms, self._drain)
+
+    def shutdown(self):
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._long_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,168 @@
+#!/bin/python3
+
+## One sampler of the border router topology, shared by all the views.
+## The sampler polls at its own rate and publishes immutable snapshots. Views read the
+## latest snapshot or are called back when it changes, so they never cause D-Bus
+## traffic themselves and adding views does not add load on wsbrd.
+## A replay of a recording (see recorder) publishes snapshots the same way, so the views
+## draw a recorded run with the same code.
+
+import time
+from collections import namedtuple
+
+# seq: incremented on every topology change, timestamp: when the change was seen,
+# keys, parent, reported: read-only copy of the eui64.NodeTable
+TopologySnapshot = namedtuple('TopologySnapshot', ['seq', 'timestamp', 'keys', 'parent', 'reported'])
+
+def _frozen(array):
+    array = array.copy()
+    array.flags.writeable = False
+    return array
+
+def _same_topology(snapshot, table):
+    return (snapshot is not None and snapshot.reported == table.reported
+            and len(snapshot.keys) == len(table.keys)
+            and bool((snapshot.keys == table.keys).all()) and bool((snapshot.parent == table.parent).all()))
+
+class TopologySampler:
+    def __init__(self, fetch, interval=1.0):
+        """
+        :param fetch: function returning the current NodeTable, None if not available
+        :param interval: seconds between two samples
+        """
+        self.fetch = fetch
+        self.interval = interval
+        # None while there is no topology (simulation not running or not ready)
+        self.latest = None
+        self._seq = 0
+        self._table = None
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """
+        callback(snapshot) is called on every change, snapshot is None when the topology is gone
+        """
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def sample(self):
+        """
+        Poll once and publish a new snapshot if the topology changed
+        :return: latest snapshot
+        """
+        return self.update(self.fetch())
+
+    def update(self, table):
+        """
+        Publish a new snapshot from a fetched table if the topology changed
+        :return: latest snapshot
+        """
+        if table is self._table:
+            return self.latest
+        self._table = table
+        if table is None:
+            if self.latest is None:
+                return None
+            snapshot = None
+        elif _same_topology(self.latest, table):
+            return self.latest
+        else:
+            self._seq += 1
+            snapshot = TopologySnapshot(self._seq, time.time(), _frozen(table.keys), _frozen(table.parent),
+                                        table.reported)
+        self.latest = snapshot
+        for callback in list(self._subscribers):
+            # a failing view must not keep the others from the snapshot
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print("Topology subscriber failed:", repr(e))
+        return snapshot
+
+    def start(self, after, submit=None):
+        """
+        Sample every interval
+        :param after: after(ms, function) schedules function, e.g. the after method of Tk
+        :param submit: submit(fetch, callback=, errback=) runs the fetch on a worker and the
+                       callback back on the scheduling thread (see tkbridge.TkBridge.submit);
+                       without it, fetch runs in the tick
+        """
+        def next_tick(*_):
+            after(int(self.interval * 1000), tick)
+
+        def fetched(table):
+            try:
+                self.update(table)
+            finally:
+                next_tick()
+
+        def tick():
+            if submit is None:
+                try:
+                    table = self.fetch()
+                except Exception as e:
+                    print("Topology fetch failed:", repr(e))
+                    next_tick()
+                    return
+                fetched(table)
+            else:
+                # the next fetch is scheduled only once this one is done, they never pile up
+                submit(self.fetch, callback=fetched, errback=next_tick)
+        tick()
+
+class TopologyReplay:
+    def __init__(self, recording, interval=0.1):
+        """
+        Plays a recorder.Recording back with the latest/interval interface of the sampler
+        :param interval: seconds between two steps while playing
+        """
+        self.recording = recording
+        self.interval = interval
+        self.speed = 1.0
+        self.playing = False
+        self.position = recording.start
+        self.latest = recording.snapshot_at(self.position)
+        self._stopped = False
+
+    def seek(self, timestamp):
+        """
+        Move to a time of the recording, clamped to its first and last record
+        :return: snapshot at that time
+        """
+        self.position = min(max(timestamp, self.recording.start), self.recording.end)
+        self.latest = self.recording.snapshot_at(self.position)
+        return self.latest
+
+    def play(self):
+        if self.position >= self.recording.end:
+            self.seek(self.recording.start)
+        self.playing = True
+
+    def pause(self):
+        self.playing = False
+
+    def start(self, after):
+        """
+        Advance position by speed times the elapsed time while playing
+        :param after: after(ms, function) schedules function, e.g. the after method of Tk
+        """
+        last = time.monotonic()
+        def tick():
+            nonlocal last
+            if self._stopped:
+                return
+            now = time.monotonic()
+            if self.playing:
+                self.seek(self.position + (now - last) * self.speed)
+                if self.position >= self.recording.end:
+                    self.playing = False
+            last = now
+            after(int(self.interval * 1000), tick)
+        tick()
+
+    def stop(self):
+        self._stopped = True
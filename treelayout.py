@@ -0,0 +1,326 @@
+#!/bin/python3
+
+import bisect
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+def tidy_tree_layout(parent, root=0, distance=1.0):
+    """
+    Reingold-Tilford tidy tree layout, in the linear time variant of Walker's algorithm
+    (Buchheim, Juenger and Leipert). Written without recursion so deep trees are fine.
+    :param parent: parent index of every node, -1 for nodes without parent;
+                   siblings are ordered by index
+    :param root: index of the root node
+    :param distance: minimal horizontal distance between two nodes of the same depth
+    :return: (n, 2) float array, column 0 is x (leftmost node at 0), column 1 the depth;
+             nodes not reachable from root get NaN
+    """
+    parent = np.asarray(parent, dtype=np.int64).tolist()
+    n = len(parent)
+    children = [[] for _ in range(n)]
+    for v, p in enumerate(parent):
+        if p >= 0:
+            children[p].append(v)
+    number = [0] * n
+    lsib = [-1] * n
+    for ch in children:
+        for k, w in enumerate(ch):
+            number[w] = k + 1
+            if k:
+                lsib[w] = ch[k-1]
+
+    order = []
+    stack = [root]
+    while stack:
+        v = stack.pop()
+        order.append(v)
+        stack.extend(reversed(children[v]))
+
+    prelim = [0.0] * n
+    mod = [0.0] * n
+    shift = [0.0] * n
+    change = [0.0] * n
+    mid = [0.0] * n
+    thread = [-1] * n
+    ancestor = list(range(n))
+
+    def next_left(v):
+        return children[v][0] if children[v] else thread[v]
+
+    def next_right(v):
+        return children[v][-1] if children[v] else thread[v]
+
+    def move_subtree(wl, wr, s):
+        subtrees = number[wr] - number[wl]
+        change[wr] -= s / subtrees
+        shift[wr] += s
+        change[wl] += s / subtrees
+        prelim[wr] += s
+        mod[wr] += s
+
+    def apportion(v, default_ancestor):
+        w = lsib[v]
+        if w < 0:
+            return default_ancestor
+        vir = vor = v
+        vil = w
+        vol = children[parent[v]][0]
+        sir = sor = mod[vir]
+        sil = mod[vil]
+        sol = mod[vol]
+        while next_right(vil) >= 0 and next_left(vir) >= 0:
+            vil = next_right(vil)
+            vir = next_left(vir)
+            vol = next_left(vol)
+            vor = next_right(vor)
+            ancestor[vor] = v
+            s = (prelim[vil] + sil) - (prelim[vir] + sir) + distance
+            if s > 0:
+                a = ancestor[vil] if parent[ancestor[vil]] == parent[v] else default_ancestor
+                move_subtree(a, v, s)
+                sir += s
+                sor += s
+            sil += mod[vil]
+            sir += mod[vir]
+            sol += mod[vol]
+            sor += mod[vor]
+        if next_right(vil) >= 0 and next_right(vor) < 0:
+            thread[vor] = next_right(vil)
+            mod[vor] += sil - sor
+        else:
+            if next_left(vir) >= 0 and next_left(vol) < 0:
+                thread[vol] = next_left(vir)
+                mod[vol] += sir - sol
+            default_ancestor = v
+        return default_ancestor
+
+    def place(v):
+        # preliminary x of v from its left sibling, once its own subtree is done
+        w = lsib[v]
+        if not children[v]:
+            prelim[v] = prelim[w] + distance if w >= 0 else 0.0
+        elif w >= 0:
+            prelim[v] = prelim[w] + distance
+            mod[v] = prelim[v] - mid[v]
+        else:
+            prelim[v] = mid[v]
+
+    # First walk, children before parents
+    for v in reversed(order):
+        ch = children[v]
+        if not ch:
+            continue
+        default_ancestor = ch[0]
+        for w in ch:
+            place(w)
+            default_ancestor = apportion(w, default_ancestor)
+        s = c = 0.0
+        for w in reversed(ch):
+            prelim[w] += s
+            mod[w] += s
+            c += change[w]
+            s += shift[w] + c
+        mid[v] = (prelim[ch[0]] + prelim[ch[-1]]) / 2
+    place(root)
+
+    # Second walk, sum up the modifiers of the ancestors
+    xy = np.full((n, 2), np.nan)
+    modsum = [0.0] * n
+    depth = [0] * n
+    for v in order:
+        xy[v, 0] = prelim[v] + modsum[v]
+        xy[v, 1] = depth[v]
+        for w in children[v]:
+            modsum[w] = modsum[v] + mod[v]
+            depth[w] = depth[v] + 1
+    if order:
+        xy[:, 0] -= np.nanmin(xy[:, 0])
+    return xy
+
+def _nearest_free(t0, lo, hi, lower):
+    """
+    Offset closest to t0, not below lower, outside all the open intervals (lo, hi)
+    """
+    order = np.argsort(lo)
+    merged = []
+    for a, b in zip(lo[order].tolist(), hi[order].tolist()):
+        if merged and a < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    def free_from(t):
+        # first allowed offset >= t
+        for a, b in merged:
+            if a < t < b:
+                return b
+        return t
+    t0 = max(t0, lower)
+    for a, b in merged:
+        if a < t0 < b:
+            if a >= lower and t0 - a <= b - t0:
+                return a
+            return free_from(b)
+    return t0
+
+class LayoutCache:
+    def __init__(self, size=16, max_changed=0.5, max_growth=2.0, distance=1.0):
+        """
+        Tidy tree layouts of the successive topologies of a mesh. A topology seen recently
+        gets its positions back from the cache. Otherwise, when the tree only changed in a few
+        subtrees, only these subtrees are laid out again and placed next to their new parent
+        without moving the other nodes.
+        :param size: number of layouts kept
+        :param max_changed: share of moved nodes above which the whole tree is laid out again
+        :param max_growth: the whole tree is laid out again once the placed subtrees made it
+                           that many times wider than its last full layout
+        :param distance: minimal horizontal distance between two nodes of the same depth
+        """
+        self.size = size
+        self.max_changed = max_changed
+        self.max_growth = max_growth
+        self.distance = distance
+        self._full_width = 0.0
+        self._layouts = OrderedDict() # topology hash -> positions
+        self._previous = None # keys, parent keys and positions of the last layout
+        # how the layouts were obtained, for statistics
+        self.hits = 0
+        self.incremental = 0
+        self.full = 0
+
+    @staticmethod
+    def topology_hash(keys, pkeys, root_key):
+        """
+        Canonical hash of a parent map given as sorted node keys and the key of their parent
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(np.uint64(root_key).tobytes())
+        h.update(np.ascontiguousarray(keys, dtype='<u8').tobytes())
+        h.update(np.ascontiguousarray(pkeys, dtype='<u8').tobytes())
+        return h.digest()
+
+    def layout(self, keys, parent, root):
+        """
+        :param keys: sorted unique integer key of every node (e.g. EUI-64)
+        :param parent: parent index of every node, -1 for the roots
+        :param root: index of the root
+        :return: read-only (n, 2) array as tidy_tree_layout
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        parent = np.asarray(parent, dtype=np.int64)
+        # the parent of a root is itself, keys only: the hash does not depend on indices
+        pkeys = keys[np.where(parent >= 0, parent, np.arange(len(parent)))]
+        digest = self.topology_hash(keys, pkeys, keys[root])
+        xy = self._layouts.get(digest)
+        if xy is not None:
+            self._layouts.move_to_end(digest)
+            self.hits += 1
+        else:
+            xy = self._relayout(keys, parent, pkeys, root)
+            if xy is None:
+                xy = tidy_tree_layout(parent, root, self.distance)
+                self._full_width = max(np.nanmax(xy[:, 0]), self.distance)
+                self.full += 1
+            else:
+                self.incremental += 1
+            xy.flags.writeable = False
+            self._layouts[digest] = xy
+            if len(self._layouts) > self.size:
+                self._layouts.popitem(last=False)
+        self._previous = (keys, pkeys, xy)
+        return xy
+
+    def _relayout(self, keys, parent, pkeys, root):
+        # None when the whole tree has to be laid out
+        if self._previous is None:
+            return None
+        prev_keys, prev_pkeys, prev_xy = self._previous
+        n = len(keys)
+        prev = np.searchsorted(prev_keys, keys).clip(0, max(len(prev_keys) - 1, 0))
+        known = (prev_keys[prev] == keys) if len(prev_keys) else np.zeros(n, dtype=bool)
+        if not known[root] or np.isnan(prev_xy[prev[root], 0]) or prev_pkeys[prev[root]] != keys[root]:
+            return None
+        # joined, moved to another parent, or not drawn before
+        changed = ~known | (prev_pkeys[prev] != pkeys) | np.isnan(prev_xy[prev, 0])
+
+        parent_list = parent.tolist()
+        children = [[] for _ in range(n)]
+        for v, p in enumerate(parent_list):
+            if p >= 0:
+                children[p].append(v)
+        # preorder: the subtree of a node is a contiguous slice starting at it
+        order = []
+        stack = [root]
+        while stack:
+            v = stack.pop()
+            order.append(v)
+            stack.extend(reversed(children[v]))
+        size = [1] * n
+        for v in reversed(order):
+            if parent_list[v] >= 0 and v != root:
+                size[parent_list[v]] += size[v]
+
+        changed = changed.tolist()
+        changed[root] = False
+        prev_depth = prev_xy[prev, 1].tolist()
+        depth = [0] * n
+        tops = [] # positions in order of the topmost changed nodes
+        fixed = []
+        k = 0
+        moved = 0
+        while k < len(order):
+            v = order[k]
+            if v != root:
+                depth[v] = depth[parent_list[v]] + 1
+            if changed[v]:
+                tops.append(k)
+                moved += size[v]
+                for w in order[k+1:k+size[v]]:
+                    depth[w] = depth[parent_list[w]] + 1
+                k += size[v]
+                continue
+            if depth[v] != prev_depth[v]:
+                return None
+            fixed.append(v)
+            k += 1
+        if moved > self.max_changed * len(order):
+            return None
+
+        xy = np.full((n, 2), np.nan)
+        xy[fixed] = prev_xy[prev[fixed]]
+        occupied = {}
+        for v in fixed:
+            occupied.setdefault(depth[v], []).append(xy[v, 0])
+        occupied = {d: sorted(xs) for d, xs in occupied.items()}
+
+        for k in tops:
+            top = order[k]
+            nodes = order[k:k+size[top]]
+            local = {v: i for i, v in enumerate(nodes)}
+            sub_parent = [local.get(parent_list[v], -1) for v in nodes]
+            sub_parent[0] = -1
+            sub = tidy_tree_layout(sub_parent, 0, self.distance)
+            sub_depth = sub[:, 1].astype(np.int64)
+            # forbidden offsets: a node of the subtree closer than distance to an occupied place
+            lo, hi = [], []
+            for d in np.unique(sub_depth).tolist():
+                xs = occupied.get(depth[top] + d)
+                if not xs:
+                    continue
+                level = sub[sub_depth == d, 0]
+                xs = np.array(xs)
+                lo.append(xs - level.max() - self.distance)
+                hi.append(xs - level.min() + self.distance)
+            # root of the subtree under its parent, unless it overlaps
+            t0 = xy[parent_list[top], 0] - sub[0, 0]
+            if lo:
+                t = _nearest_free(t0, np.concatenate(lo), np.concatenate(hi), 0.0)
+            else:
+                t = max(t0, 0.0)
+            xy[nodes, 0] = sub[:, 0] + t
+            xy[nodes, 1] = depth[top] + sub[:, 1]
+            for v in nodes:
+                bisect.insort(occupied.setdefault(depth[v], []), xy[v, 0])
+        if np.nanmax(xy[:, 0]) > self.max_growth * self._full_width:
+            return None
+        return xy